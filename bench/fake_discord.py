@@ -0,0 +1,251 @@
+"""A local stand-in for the Discord REST endpoints the bot uses.
+
+Serves message history, bulk delete, single delete and send for
+in-memory channels, with Discord's per-route rate limit headers and 429
+responses, so discord.py's own HTTP client can be pointed at it (see
+``FakeDiscord.api_base``). It is not a gateway: guilds and channels are
+seeded directly into the client's cache by the benchmark.
+"""
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import discord
+from aiohttp import web
+
+# (requests, per seconds) per route and channel, roughly what Discord
+# reports; GLOBAL_LIMIT applies across all routes.
+ROUTE_LIMITS = {
+    "history": (5, 5.0),
+    "bulk_delete": (1, 1.0),
+    "delete": (5, 5.0),
+    "send": (5, 5.0),
+}
+GLOBAL_LIMIT = (50, 1.0)
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+BOT_USER = {"id": "100000000000000001", "username": "purgebench",
+            "discriminator": "0", "global_name": None, "avatar": None, "bot": True}
+APPLICATION = {"id": BOT_USER["id"], "name": "purgebench", "description": "",
+               "icon": None, "bot_public": False, "bot_require_code_grant": False,
+               "owner": BOT_USER, "verify_key": "", "flags": 0}
+
+
+def _json(payload, status=200, headers=None):
+    # discord.py only decodes bodies whose content type is exactly
+    # "application/json", without the charset aiohttp adds by default.
+    return web.Response(body=json.dumps(payload).encode(), status=status,
+                        headers={**(headers or {}), "Content-Type": "application/json"})
+
+
+class _Window:
+    """A fixed window counter that behaves like one Discord bucket."""
+
+    __slots__ = ("limit", "per", "remaining", "reset_at")
+
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def hit(self, now):
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+class FakeDiscord:
+    """In-memory channels served over HTTP with simulated rate limits.
+
+    ``rate_scale`` divides every rate limit window, so 10 runs the same
+    request pattern ten times faster. 0 turns rate limiting off.
+    """
+
+    def __init__(self, rate_scale: float = 1.0):
+        self.rate_scale = rate_scale
+        self.channels = {}
+        self.stats = {"requests": 0, "rate_limited": 0, "bulk_deleted": 0,
+                      "single_deleted": 0, "sent": 0}
+        self._windows = {}
+        self._runner = None
+        self.port = None
+
+    @property
+    def api_base(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api/v10"
+
+    # -- Seeding ----------------------------------------------------------
+
+    def add_channel(self, guild_id: int, channel_id: int):
+        self.channels[channel_id] = {"guild_id": guild_id, "messages": {}}
+
+    def seed_messages(self, channel_id: int, count: int, old_fraction: float = 0.0):
+        """Add ``count`` messages; ``old_fraction`` of them past the bulk delete age."""
+        messages = self.channels[channel_id]["messages"]
+        now = datetime.now(timezone.utc)
+        old = int(count * old_fraction)
+        for index in range(count):
+            if index < old:
+                created = now - timedelta(days=30) + timedelta(seconds=index)
+            else:
+                created = now - timedelta(hours=1) + timedelta(milliseconds=index)
+            message_id = discord.utils.time_snowflake(created) + index % 4096
+            messages[message_id] = created
+
+    def remaining_messages(self) -> int:
+        return sum(len(channel["messages"]) for channel in self.channels.values())
+
+    # -- Server -----------------------------------------------------------
+
+    async def start(self, port: int = 0):
+        app = web.Application()
+        app.router.add_get("/api/v10/users/@me", self.get_me)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self.application_info)
+        app.router.add_get("/api/v10/channels/{channel_id}/messages", self.history)
+        app.router.add_post("/api/v10/channels/{channel_id}/messages", self.send)
+        app.router.add_post("/api/v10/channels/{channel_id}/messages/bulk-delete",
+                            self.bulk_delete)
+        app.router.add_delete("/api/v10/channels/{channel_id}/messages/{message_id}",
+                              self.delete)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _limit(self, route, channel_id):
+        """``(None, headers)`` to proceed, or a ready 429 as ``(response, {})``."""
+        self.stats["requests"] += 1
+        if not self.rate_scale:
+            return None, {}
+        now = time.monotonic()
+        limit, per = ROUTE_LIMITS[route]
+        key = (route, channel_id)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _Window(limit, per / self.rate_scale)
+        global_window = self._windows.get("global")
+        if global_window is None:
+            global_window = self._windows["global"] = _Window(
+                GLOBAL_LIMIT[0], GLOBAL_LIMIT[1] / self.rate_scale)
+        is_global = not global_window.hit(now)
+        if is_global or not window.hit(now):
+            self.stats["rate_limited"] += 1
+            blocked = global_window if is_global else window
+            retry_after = max(blocked.reset_at - now, 0.001)
+            headers = {"Via": "1.1 google", "Retry-After": f"{retry_after:.3f}",
+                       "X-RateLimit-Scope": "global" if is_global else "user"}
+            if is_global:
+                headers["X-RateLimit-Global"] = "true"
+            return _json(
+                {"message": "You are being rate limited.", "retry_after": retry_after,
+                 "global": is_global}, status=429, headers=headers), {}
+        headers = {
+            "X-RateLimit-Bucket": f"{route}:{channel_id}",
+            "X-RateLimit-Limit": str(window.limit),
+            "X-RateLimit-Remaining": str(window.remaining),
+            "X-RateLimit-Reset-After": f"{max(window.reset_at - now, 0):.3f}",
+            "X-RateLimit-Reset": f"{time.time() + max(window.reset_at - now, 0):.3f}",
+        }
+        return None, headers
+
+    def _channel(self, request):
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        if channel is None:
+            raise web.HTTPNotFound(
+                body=b'{"message": "Unknown Channel", "code": 10003}',
+                headers={"Content-Type": "application/json"})
+        return channel
+
+    def _message_payload(self, channel_id, message_id, created):
+        return {
+            "id": str(message_id), "channel_id": str(channel_id), "type": 0,
+            "content": "", "author": BOT_USER, "timestamp": created.isoformat(),
+            "edited_timestamp": None, "tts": False, "mention_everyone": False,
+            "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+            "pinned": False,
+        }
+
+    # -- Endpoints --------------------------------------------------------
+
+    async def get_me(self, _request):
+        return _json(BOT_USER)
+
+    async def application_info(self, _request):
+        return _json(APPLICATION)
+
+    async def history(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        channel = self._channel(request)
+        limited, headers = self._limit("history", channel_id)
+        if limited is not None:
+            return limited
+        limit = min(int(request.query.get("limit", 50)), 100)
+        ids = sorted(channel["messages"])
+        if "after" in request.query:
+            after = int(request.query["after"])
+            page = [i for i in ids if i > after][:limit]
+        else:
+            before = int(request.query.get("before", 1 << 63))
+            page = [i for i in ids if i < before][-limit:]
+        # Discord returns every page newest first.
+        payload = [self._message_payload(channel_id, i, channel["messages"][i])
+                   for i in reversed(page)]
+        return _json(payload, headers=headers)
+
+    async def bulk_delete(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        channel = self._channel(request)
+        limited, headers = self._limit("bulk_delete", channel_id)
+        if limited is not None:
+            return limited
+        ids = [int(i) for i in (await request.json())["messages"]]
+        if not 2 <= len(ids) <= 100:
+            return _json({"message": "Invalid Form Body", "code": 50035},
+                         status=400, headers=headers)
+        cutoff = datetime.now(timezone.utc) - BULK_DELETE_MAX_AGE
+        messages = channel["messages"]
+        if any(i in messages and messages[i] < cutoff for i in ids):
+            return _json(
+                {"message": "You can only bulk delete messages that are under "
+                            "14 days old.", "code": 50034},
+                status=400, headers=headers)
+        for i in ids:
+            if messages.pop(i, None) is not None:
+                self.stats["bulk_deleted"] += 1
+        return web.Response(status=204, headers=headers)
+
+    async def delete(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        channel = self._channel(request)
+        limited, headers = self._limit("delete", channel_id)
+        if limited is not None:
+            return limited
+        if channel["messages"].pop(int(request.match_info["message_id"]), None) is None:
+            return _json({"message": "Unknown Message", "code": 10008},
+                         status=404, headers=headers)
+        self.stats["single_deleted"] += 1
+        return web.Response(status=204, headers=headers)
+
+    async def send(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        channel = self._channel(request)
+        limited, headers = self._limit("send", channel_id)
+        if limited is not None:
+            return limited
+        created = datetime.now(timezone.utc)
+        message_id = (discord.utils.time_snowflake(created)
+                      + len(channel["messages"]) % 4096)
+        channel["messages"][message_id] = created
+        self.stats["sent"] += 1
+        payload = self._message_payload(channel_id, message_id, created)
+        payload["content"] = (await request.json()).get("content", "")
+        return _json(payload, headers=headers)
@@ -0,0 +1,330 @@
+"""Benchmark the scheduler and purge paths against a fake Discord.
+
+    python -m bench.run [--guilds 4] [--channels 5] [--messages 400] ...
+
+Starts ``bench.fake_discord`` on a local port and points discord.py at it,
+seeds synthetic guilds and channels into the client's cache, then drives
+the real cog callbacks with stand-in interactions:
+
+- purge:    PurgeBot's /purge in every channel at once
+- schedule: SchedulePurge's /schedule_purge, ``--jobs`` one-shot jobs
+- minutes:  MinutesPurge's /schedule_one_purge, ``--jobs`` jobs
+
+Scheduled jobs are created through the commands (which only accept
+minute granularity) and then pulled forward to fire within ``--spread``
+seconds, so a run takes seconds rather than minutes. Reports commands,
+jobs and deletes per second, scheduler lag percentiles and 429 counts.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+from discord.ext import commands
+
+from bench.fake_discord import BOT_USER, FakeDiscord
+from core.executor import PurgeExecutor
+from core.jobstore import JobStore, job_timestamp
+from core.message_index import MessageIndex
+from core.metrics import http_trace
+from core.preferences import PreferenceStore
+from core.preview import HistoryCache
+from core.profiles import bot_options
+from core.scheduler import SchedulerCore
+
+SCENARIOS = ("purge", "schedule", "minutes")
+COGS = ("cogs.PurgeBot", "cogs.SchedulePurge", "cogs.MinutesPurge")
+INVOKER_ID = 200000000000000001
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **_kwargs):
+        self._done = True
+        self.messages.append(content)
+
+    async def defer(self, **_kwargs):
+        self._done = True
+
+
+class FakeInteraction:
+    """Just enough of ``discord.Interaction`` for the purge cogs."""
+
+    def __init__(self, client, guild, channel, user):
+        self.client = client
+        self.guild = guild
+        self.channel = channel
+        self.user = user
+        self.response = FakeResponse()
+        self.followup = SimpleNamespace(send=self.response.send_message)
+
+    async def edit_original_response(self, **kwargs):
+        pass
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.fake = FakeDiscord(rate_scale=args.rate_scale)
+        self.guilds = []
+        self.fired = []
+
+    async def setup(self):
+        await self.fake.start()
+        discord.http.Route.BASE = self.fake.api_base
+        self.workdir = tempfile.mkdtemp(prefix="purgebench-")
+        client = commands.AutoShardedBot(command_prefix=".", http_trace=http_trace(),
+                                         **bot_options("lean"))
+        await client.login("bench-token")
+        client.job_store = JobStore(os.path.join(self.workdir, "jobs.sqlite"))
+        await client.job_store.open()
+        client.purge_executor = PurgeExecutor()
+        client.purge_executor.start()
+        # Seeded messages never arrive as gateway events, so purges miss the
+        # index and exercise the history path.
+        client.message_index = MessageIndex(os.path.join(self.workdir, "index.bin"))
+        client.history_cache = HistoryCache()
+        client.scheduler = SchedulerCore(client, client.job_store,
+                                         client.purge_executor,
+                                         index=client.message_index)
+        client.preferences = PreferenceStore(os.path.join(self.workdir, "prefs.json"),
+                                             os.path.join(self.workdir, "tz.json"))
+        await client.preferences.load()
+        for cog in COGS:
+            await client.load_extension(cog)
+        self.client = client
+        self._seed_guilds()
+        # Legacy job files are looked up relative to the working directory.
+        cwd = os.getcwd()
+        os.chdir(self.workdir)
+        try:
+            await client.scheduler.start(lambda _channel_id: None)
+        finally:
+            os.chdir(cwd)
+        run_job = client.scheduler.run_job
+
+        async def timed_run_job(job_id):
+            fired = time.time()
+            await run_job(job_id)
+            self.fired.append((job_id, fired, time.time()))
+
+        client.scheduler.timer.callback = timed_run_job
+
+    def _seed_guilds(self):
+        state = self.client._connection
+        everyone = str(discord.Permissions.all().value)
+        for g in range(self.args.guilds):
+            guild_id = (g + 1) << 32
+            channels = []
+            for c in range(self.args.channels):
+                channel_id = guild_id + c + 1
+                channels.append({"id": str(channel_id), "type": 0, "name": f"bench-{c}",
+                                 "position": c, "permission_overwrites": []})
+                self.fake.add_channel(guild_id, channel_id)
+                self.fake.seed_messages(channel_id, self.args.messages,
+                                        self.args.old_fraction)
+            guild = discord.Guild(data={
+                "id": str(guild_id), "name": f"bench-{g}", "owner_id": BOT_USER["id"],
+                "channels": channels,
+                "roles": [{"id": str(guild_id), "name": "@everyone",
+                           "permissions": everyone, "position": 0, "color": 0,
+                           "hoist": False, "managed": False, "mentionable": False}],
+                "members": [{"user": BOT_USER, "roles": [], "joined_at": None,
+                             "deaf": False, "mute": False, "flags": 0}],
+                "member_count": 2,
+            }, state=state)
+            state._add_guild(guild)
+            self.guilds.append(guild)
+
+    def _interaction(self, guild, channel):
+        return FakeInteraction(self.client, guild, channel, self._invoker(guild))
+
+    def _invoker(self, guild):
+        return discord.Member(data={
+            "user": {"id": str(INVOKER_ID), "username": "bench-admin",
+                     "discriminator": "0", "global_name": None, "avatar": None},
+            "roles": [], "joined_at": None, "deaf": False, "mute": False, "flags": 0,
+        }, guild=guild, state=self.client._connection)
+
+    def _channels(self):
+        for guild in self.guilds:
+            for channel in guild.text_channels:
+                yield guild, channel
+
+    async def teardown(self):
+        self.client.scheduler.stop()
+        self.client.purge_executor.stop()
+        await self.client.job_store.close()
+        await self.client.close()
+        await self.fake.stop()
+
+    def _deleted(self):
+        return self.fake.stats["bulk_deleted"] + self.fake.stats["single_deleted"]
+
+    # -- Scenarios --------------------------------------------------------
+
+    async def purge(self):
+        cog = self.client.get_cog("PurgeBot")
+        latencies = []
+
+        async def one(guild, channel):
+            interaction = self._interaction(guild, channel)
+            started = time.perf_counter()
+            await cog.purge.callback(cog, interaction, self.args.amount, "recent")
+            latencies.append(time.perf_counter() - started)
+
+        deleted, started = self._deleted(), time.perf_counter()
+        await asyncio.gather(*(one(guild, channel)
+                               for guild, channel in self._channels()))
+        elapsed = time.perf_counter() - started
+        return {
+            "commands": len(latencies),
+            "elapsed": elapsed,
+            "deleted": self._deleted() - deleted,
+            "command_p50": percentile(latencies, 0.5),
+            "command_p95": percentile(latencies, 0.95),
+        }
+
+    async def schedule(self):
+        cog = self.client.get_cog("SchedulePurge")
+        when = datetime.now(timezone.utc) + timedelta(minutes=2)
+
+        async def create(guild, channel):
+            interaction = self._interaction(guild, channel)
+            await cog.schedule_purge.callback(
+                cog, interaction, channel, when.strftime("%Y-%m-%d"),
+                when.strftime("%H:%M"), self.args.amount, "none")
+
+        return await self._run_jobs(create)
+
+    async def minutes(self):
+        cog = self.client.get_cog("MinutesPurge")
+
+        async def create(guild, channel):
+            interaction = self._interaction(guild, channel)
+            await cog.schedule_one_purge.callback(cog, interaction, channel, 1,
+                                                  self.args.amount)
+
+        return await self._run_jobs(create)
+
+    async def _run_jobs(self, create):
+        targets = list(self._channels())
+        started = time.perf_counter()
+        for index in range(self.args.jobs):
+            await create(*targets[index % len(targets)])
+        create_elapsed = time.perf_counter() - started
+
+        # Pull every job forward so they come due over the next --spread seconds.
+        store, timer = self.client.job_store, self.client.scheduler.timer
+        jobs = await store.all_jobs()
+        base = time.time() + 0.5
+        due = {}
+        for index, job in enumerate(jobs):
+            moment = datetime.fromtimestamp(base + self.args.spread * index / len(jobs),
+                                            timezone.utc)
+            job["scheduled_time"] = moment.isoformat()
+            await store.update_job(job)
+            due[job["id"]] = job_timestamp(job)
+            timer.schedule(job["id"], due[job["id"]])
+
+        self.fired.clear()
+        deleted, started = self._deleted(), time.perf_counter()
+        while len(self.fired) < len(jobs):
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        lags = [fired - due[job_id] for job_id, fired, _ in self.fired]
+        return {
+            "commands": self.args.jobs,
+            "commands_per_sec": (self.args.jobs / create_elapsed
+                                 if create_elapsed else None),
+            "jobs": len(jobs),
+            "elapsed": elapsed,
+            "jobs_per_sec": len(jobs) / elapsed,
+            "deleted": self._deleted() - deleted,
+            "lag_p50": percentile(lags, 0.5),
+            "lag_p95": percentile(lags, 0.95),
+            "lag_p99": percentile(lags, 0.99),
+        }
+
+
+async def main(args):
+    bench = Bench(args)
+    await bench.setup()
+    results = {}
+    try:
+        for scenario in args.scenarios:
+            rate_limited = bench.fake.stats["rate_limited"]
+            result = await getattr(bench, scenario)()
+            result["deletes_per_sec"] = result["deleted"] / result["elapsed"]
+            result["rate_limited"] = bench.fake.stats["rate_limited"] - rate_limited
+            results[scenario] = result
+    finally:
+        await bench.teardown()
+    return results
+
+
+def report(results):
+    for scenario, result in results.items():
+        print(f"{scenario}:")
+        for key, value in result.items():
+            if isinstance(value, float):
+                value = f"{value:.4f}"
+            print(f"  {key:<18} {value}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS),
+                        metavar="scenario",
+                        help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--guilds", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=5, help="channels per guild")
+    parser.add_argument("--messages", type=int, default=400,
+                        help="messages per channel")
+    parser.add_argument("--old-fraction", type=float, default=0.1,
+                        help="share of messages older than 14 days (single deletes)")
+    parser.add_argument("--amount", type=int, default=20, help="messages per purge")
+    parser.add_argument("--jobs", type=int, default=100,
+                        help="jobs per scheduling scenario")
+    parser.add_argument("--spread", type=float, default=2.0,
+                        help="seconds over which scheduled jobs come due"
+                             " (0: all at once)")
+    parser.add_argument("--rate-scale", type=float, default=10.0,
+                        help="speed up the fake rate limit windows (0 disables them)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # Expected under load; counted from the fake server instead.
+    logging.getLogger("discord.http").setLevel(logging.ERROR)
+    results = asyncio.run(main(args))
+    report(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
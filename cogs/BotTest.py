@@ -1,7 +1,11 @@
+import logging
+
 import discord
+import pytz
 from discord import app_commands
 from discord.ext import commands
-import pytz
+
+log = logging.getLogger(__name__)
 
 
 class BotTest(commands.Cog):
@@ -17,8 +21,8 @@ class BotTest(commands.Cog):
     try:
       await interaction.response.send_message(
           content="Hello, the bot is working")
-    except Exception as e:
-      print(f"Error in bottest command: {e}")
+    except Exception:
+      log.exception("Error in bottest command")
 
 
 #common_timezones = pytz.common_timezones_set
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import threading
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from core.profiles import memory_report
+from core.profiling import hottest_frames, sample_stacks, write_profile
+
+
+def _megabytes(value) -> str:
+    return f"{value / 2**20:.1f} MB" if value is not None else "n/a"
+
+
+class Diagnostics(commands.Cog):
+    """Owner-only commands for looking at the running bot."""
+
+    def __init__(self, client: commands.Bot):
+        self.client = client
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if await self.client.is_owner(interaction.user):
+            return True
+        await interaction.response.send_message(
+            "Only the bot owner can use this command.", ephemeral=True)
+        return False
+
+    @app_commands.command(name="memory_report",
+                          description="Show the bot's memory use and cache sizes.")
+    @app_commands.default_permissions(administrator=True)
+    async def memory_report(self, interaction: discord.Interaction):
+        # Run once under each BOT_PROFILE to compare them.
+        report = memory_report(self.client)
+        embed = discord.Embed(title=f"Memory report ({report['profile']} profile)",
+                              color=discord.Color.blue())
+        embed.add_field(name="Resident memory", value=_megabytes(report["rss_bytes"]))
+        embed.add_field(name="Per 1k guilds",
+                        value=_megabytes(report["rss_per_1k_guilds"]))
+        embed.add_field(name="Guilds", value=str(report["guilds"]))
+        embed.add_field(name="Channels", value=str(report["channels"]))
+        embed.add_field(name="Cached members", value=str(report["cached_members"]))
+        embed.add_field(name="Cached users", value=str(report["cached_users"]))
+        embed.add_field(name="Cached messages", value=str(report["cached_messages"]))
+        embed.add_field(name="Indexed messages",
+                        value=f"{report['indexed_messages']} in "
+                              f"{report['indexed_channels']} channels "
+                              f"({_megabytes(report['index_bytes'])})")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(
+        name="profile_dump",
+        description="Sample the event loop for a while and save the profile.")
+    @app_commands.describe(seconds="How long to sample for (1-60 seconds).")
+    @app_commands.default_permissions(administrator=True)
+    async def profile_dump(self, interaction: discord.Interaction,
+                           seconds: app_commands.Range[int, 1, 60] = 10):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        # Commands run on the loop's thread; sample it from a worker thread.
+        loop_thread = threading.get_ident()
+        counts = await asyncio.to_thread(sample_stacks, loop_thread, seconds)
+        path = await asyncio.to_thread(write_profile, counts)
+        samples = sum(counts.values())
+        embed = discord.Embed(
+            title=f"Event loop profile ({seconds}s, {samples} samples)",
+            description=f"Folded stacks saved to `{path}`.",
+            color=discord.Color.blue())
+        hottest = "\n".join(f"{count * 100 // max(samples, 1)}% `{frame}`"
+                             for frame, count in hottest_frames(counts, 8))
+        embed.add_field(name="Hottest frames", value=hottest[:1024] or "n/a",
+                        inline=False)
+        watchdog = getattr(self.client, "watchdog", None)
+        if watchdog is not None:
+            embed.add_field(name="Loop stalls (recent)",
+                            value=str(len(watchdog.stalls)))
+        await interaction.followup.send(
+            embed=embed, file=discord.File(path, os.path.basename(path)),
+            ephemeral=True)
+
+
+async def setup(client: commands.Bot) -> None:
+    await client.add_cog(Diagnostics(client))
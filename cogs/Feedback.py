@@ -1,7 +1,11 @@
+import logging
+
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+log = logging.getLogger(__name__)
+
 
 class Feedback(commands.Cog):
 
@@ -25,8 +29,8 @@ class Feedback(commands.Cog):
         await interaction.response.send_message(
             "Your feedback has been forwarded to the bot owner. Thank you!",
             ephemeral=True)
-      except discord.HTTPException as e:
-        print(f"Error sending feedback to bot owner: {e}")
+      except discord.HTTPException:
+        log.exception("Error sending feedback to bot owner")
         await interaction.response.send_message(
             "An error occurred while forwarding your feedback.",
             ephemeral=True)
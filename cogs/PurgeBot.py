@@ -1,13 +1,107 @@
+import contextlib
+from datetime import datetime, timedelta
 
 import discord
 from discord import app_commands
 from discord.ext import commands
+from discord.ui import View
+
+from core.filters import FILTER_OPTIONS, describe_filters, filter_spec
+from core.preview import PREVIEW_CACHE_TTL, describe_preview, preview_purge
+from core.purge import BULK_DELETE_MAX_AGE, run_purge
+from core.timezones import localize, resolve_timezone
+
+
+def parse_local_time(text: str | None, tz):
+    if text is None:
+        return None
+    try:
+        return localize(datetime.strptime(text.strip(), "%Y-%m-%d %H:%M"), tz)
+    except ValueError:
+        raise ValueError(f"'{text}' is not a time like 2024-05-01 18:30.") from None
+
+
+def progress_reporter(interaction: discord.Interaction):
+    async def report_progress(stats):
+        # The interaction token expires after 15 minutes; progress is
+        # best-effort and must never abort the purge itself.
+        with contextlib.suppress(discord.HTTPException):
+            await interaction.edit_original_response(
+                content=f"Processing... {stats.deleted} deleted so far "
+                        f"({stats.scanned} scanned).")
+
+    return report_progress
+
+
+async def report_error(interaction: discord.Interaction, error: Exception):
+    # The purge commands respond before purging, so later errors are followups.
+    if interaction.response.is_done():
+        await interaction.followup.send(content=str(error), ephemeral=True)
+    else:
+        await interaction.response.send_message(content=str(error), ephemeral=True)
+
+
+class ConfirmPurgeView(View):
+    """Runs the purge a preview described, while its history is still cached."""
+
+    def __init__(self, cog, user_id: int, channel: discord.TextChannel, amount: int,
+                 options: dict):
+        super().__init__(timeout=PREVIEW_CACHE_TTL)
+        self.cog = cog
+        self.user_id = user_id
+        self.channel = channel
+        self.amount = amount
+        self.options = options
+
+    @discord.ui.button(label="Purge now", style=discord.ButtonStyle.danger)
+    async def confirm(self, interaction: discord.Interaction,
+                      _button: discord.ui.Button):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message(
+                "Only the member who asked for the preview can confirm it.",
+                ephemeral=True)
+            return
+        self.stop()
+        await self.cog.start_purge(interaction, self.channel, self.amount, self.options)
 
 
 class PurgeBot(commands.Cog):
     def __init__(self, client: commands.Bot):
         self.client = client
 
+    async def purge_channel(
+            self, interaction: discord.Interaction) -> discord.TextChannel | None:
+        """The channel to purge, or None (after telling the user why not)."""
+        # Ensure the interaction is in a guild
+        if not interaction.guild:
+            await interaction.response.send_message("This command can only be used within a server.", ephemeral=True)
+            return None
+
+        # The lean profile doesn't cache members; the interaction carries the
+        # invoking member with its roles and permissions.
+        member = interaction.guild.get_member(interaction.user.id) or interaction.user
+
+        if not isinstance(member, discord.Member):
+            await interaction.response.send_message("Could not retrieve member information.", ephemeral=True)
+            return None
+
+        roles = [role.name for role in member.roles]
+        if "Admin" not in roles and not member.guild_permissions.manage_messages:
+            await interaction.response.send_message("You do not have the required permissions to use this command.", ephemeral=True)
+            return None
+
+        channel = interaction.channel
+        if not isinstance(channel, discord.TextChannel):
+            await interaction.response.send_message("This command can only be used in text channels.")
+            return None
+
+        permissions = channel.permissions_for(channel.guild.me)
+        if not permissions.manage_messages or not permissions.read_message_history:
+            await interaction.response.send_message("I do not have the necessary permissions in this channel.")
+            return None
+
+        return channel
+
     @app_commands.command(name="purge_bot_help", description="Purge bot help and Information")
     async def purgehelp(self, interaction: discord.Interaction):
         embed = discord.Embed(  # Here we assign the discord.Embed object to embed
@@ -20,6 +114,10 @@ class PurgeBot(commands.Cog):
                 "Use:\n"
                 "- The /purge command to delete up to 100 messages in a channel.\n"
                 "- The /purge_old command to delete messages older than 14 days\n"
+                "- The /purge_window command to delete everything sent between two "
+                "times, or older than a number of days.\n"
+                "- The /purge_preview command to see what /purge would delete, and "
+                "how long it would take, before running it.\n"
                 #"-- Use this command only if /purge does not remove messages in the channel.--\n"
                 #"- The /schedule_purge command to schedule a purge the channel you are currently in.\n"
                 #"- The /view_jobs command to view all scheduled purge jobs.\n"
@@ -28,51 +126,177 @@ class PurgeBot(commands.Cog):
         )
         await interaction.response.send_message(embed=embed , ephemeral=True)
 
-    @app_commands.command(name="purge", description="Purge messages. Choose 'recent' or 'old' for older than 14 days.")
-    async def purge(self, interaction: discord.Interaction, amount: int, type: str = "recent"):
-         # Ensure the interaction is in a guild
-        if not interaction.guild:
-            await interaction.response.send_message("This command can only be used within a server.", ephemeral=True)
-            return
+    async def purge_options(self, interaction: discord.Interaction, type: str,
+                            **options) -> dict | None:
+        """run_purge arguments for /purge and /purge_preview.
 
-        member = interaction.guild.get_member(interaction.user.id)
+        None (after telling the user why not) if the options are invalid.
+        """
+        if type not in ("recent", "old"):
+            await interaction.response.send_message("Invalid type specified. Please use 'recent' or 'old'.")
+            return None
+        # With filters, amount is how many matching messages to delete.
+        try:
+            zone_name = self.client.preferences.get(
+                interaction.user.id, "timezone", "UTC")
+            tz = resolve_timezone(zone_name)
+            options["after"] = parse_local_time(options["after"], tz)
+            options["before"] = parse_local_time(options["before"], tz)
+            filters = filter_spec(
+                **options, message_content=self.client.intents.message_content)
+        except ValueError as e:
+            await interaction.response.send_message(f"Invalid filter: {e}",
+                                                    ephemeral=True)
+            return None
+        if type == "old":
+            # Only history past the bulk-delete cutoff is fetched at all.
+            return {"filters": filters, "oldest_first": True,
+                    "before": discord.utils.utcnow() - BULK_DELETE_MAX_AGE}
+        return {"filters": filters}
 
-        if member is None:
-            await interaction.response.send_message("Could not retrieve member information.", ephemeral=True)
-            return
+    async def start_purge(self, interaction: discord.Interaction,
+                          channel: discord.TextChannel, amount: int, options: dict):
+        filters = options["filters"]
+        matching = f" ({describe_filters(filters)})" if filters else ""
+        old = " older than 14 days" if options.get("oldest_first") else ""
+        if old:
+            await interaction.response.send_message("Processing... This might take some time.")
+        else:
+            await interaction.response.send_message("Purging recent messages...")
+        # Queued behind any scheduled or retention purge of the same channel.
+        executor = self.client.purge_executor
+        stats = await executor.submit(channel.id, run_purge, self.client.job_store,
+                                      channel, amount, limiter=executor.limiter,
+                                      progress=progress_reporter(interaction),
+                                      index=self.client.message_index,
+                                      cache=self.client.history_cache, **options)
+        await interaction.followup.send(
+            f"Deleted {stats.deleted} messages{old}{matching}.")
 
-        roles = [role.name for role in member.roles]
-        if "Admin" not in roles and not member.guild_permissions.manage_messages:
-            await interaction.response.send_message("You do not have the required permissions to use this command.", ephemeral=True)
+    @app_commands.command(name="purge", description="Purge messages. Choose 'recent' or 'old' for older than 14 days.")
+    @app_commands.describe(**FILTER_OPTIONS)
+    async def purge(self, interaction: discord.Interaction, amount: int,
+                    type: str = "recent", author: discord.Member | None = None,
+                    role: discord.Role | None = None, bots: bool = False,
+                    after: str | None = None, before: str | None = None,
+                    regex: str | None = None, attachments: bool = False,
+                    keep_pinned: bool = False):
+        channel = await self.purge_channel(interaction)
+        if channel is None:
             return
+        options = await self.purge_options(
+            interaction, type, author=author, role=role, bots=bots, after=after,
+            before=before, regex=regex, attachments=attachments,
+            keep_pinned=keep_pinned)
+        if options is not None:
+            await self.start_purge(interaction, channel, amount, options)
 
-        channel = interaction.channel
-        if not isinstance(channel, discord.TextChannel):
-            await interaction.response.send_message("This command can only be used in text channels.")
+    @app_commands.command(
+        name="purge_preview",
+        description="Count what /purge would delete, without deleting anything.")
+    @app_commands.describe(**FILTER_OPTIONS)
+    async def purge_preview(self, interaction: discord.Interaction, amount: int,
+                            type: str = "recent", author: discord.Member | None = None,
+                            role: discord.Role | None = None, bots: bool = False,
+                            after: str | None = None, before: str | None = None,
+                            regex: str | None = None, attachments: bool = False,
+                            keep_pinned: bool = False):
+        channel = await self.purge_channel(interaction)
+        if channel is None:
             return
-
-        permissions = channel.permissions_for(channel.guild.me)
-        if not permissions.manage_messages or not permissions.read_message_history:
-            await interaction.response.send_message("I do not have the necessary permissions in this channel.")
+        options = await self.purge_options(
+            interaction, type, author=author, role=role, bots=bots, after=after,
+            before=before, regex=regex, attachments=attachments,
+            keep_pinned=keep_pinned)
+        if options is None:
             return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        # The pages read here are cached briefly, so confirming reuses them.
+        preview = await preview_purge(self.client.job_store, channel, amount,
+                                      index=self.client.message_index,
+                                      cache=self.client.history_cache, **options)
+        embed = discord.Embed(title="Purge preview",
+                              description=describe_preview(preview),
+                              color=discord.Color.blue())
+        if options["filters"]:
+            embed.add_field(name="Filters", value=describe_filters(options["filters"]))
+        # Nothing to confirm when the preview found nothing.
+        view = (ConfirmPurgeView(self, interaction.user.id, channel, amount, options)
+                if preview.total else discord.utils.MISSING)
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
 
-        if type == "recent":
-            await interaction.response.send_message("Purging recent messages...")
-            await channel.purge(limit=amount)
-        elif type == "old":
-            await interaction.response.send_message("Processing... This might take some time.")
-            deleted = 0
-            async for message in channel.history(limit=amount, oldest_first=True):
-                if (discord.utils.utcnow() - message.created_at).days > 14:
-                    await message.delete()
-                    deleted += 1
-            await interaction.followup.send(f"Deleted {deleted} messages older than 14 days.")
-        else:
-            await interaction.response.send_message("Invalid type specified. Please use 'recent' or 'old'.")
+    @purge_preview.error
+    async def purge_preview_error(self, interaction: discord.Interaction,
+                                  error: Exception):
+        await report_error(interaction, error)
 
     @purge.error
     async def purge_error(self, interaction: discord.Interaction, error: Exception):
-        await interaction.response.send_message(content=str(error), ephemeral=True)
+        await report_error(interaction, error)
+
+    @app_commands.command(
+        name="purge_window",
+        description="Purge every message sent between two times, "
+                    "or older than a number of days.")
+    @app_commands.describe(
+        after="Delete messages sent after this time "
+              "(YYYY-MM-DD HH:MM, your timezone)",
+        before="Delete messages sent before this time "
+               "(YYYY-MM-DD HH:MM, your timezone)",
+        older_than_days="Delete messages older than this many days "
+                        "(instead of 'before')")
+    async def purge_window(self, interaction: discord.Interaction,
+                           after: str | None = None, before: str | None = None,
+                           older_than_days: app_commands.Range[int, 1] | None = None):
+        channel = await self.purge_channel(interaction)
+        if channel is None:
+            return
+
+        try:
+            zone_name = self.client.preferences.get(
+                interaction.user.id, "timezone", "UTC")
+            tz = resolve_timezone(zone_name)
+            start, end = parse_local_time(after, tz), parse_local_time(before, tz)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+        if older_than_days is not None:
+            if end is not None:
+                await interaction.response.send_message(
+                    "Give either 'before' or 'older_than_days', not both.",
+                    ephemeral=True)
+                return
+            end = discord.utils.utcnow() - timedelta(days=older_than_days)
+        if start is None and end is None:
+            await interaction.response.send_message(
+                "Give 'after', 'before' or 'older_than_days' to set the window.",
+                ephemeral=True)
+            return
+        if start is not None and end is not None and start >= end:
+            await interaction.response.send_message(
+                "'after' must be earlier than 'before'.", ephemeral=True)
+            return
+
+        # Message ids encode their send time, so the window's edges become
+        # before/after cursors: the scan starts at one edge, stops at the
+        # other, and never fetches a message outside it.
+        window = filter_spec(after=start, before=end)
+        await interaction.response.send_message(
+            f"Purging messages ({describe_filters(window)})...")
+        executor = self.client.purge_executor
+        stats = await executor.submit(channel.id, run_purge, self.client.job_store,
+                                      channel, None, limiter=executor.limiter,
+                                      before=window.get("before"),
+                                      after=window.get("after"),
+                                      progress=progress_reporter(interaction),
+                                      index=self.client.message_index)
+        await interaction.followup.send(
+            f"Deleted {stats.deleted} messages ({describe_filters(window)}).")
+
+    @purge_window.error
+    async def purge_window_error(self, interaction: discord.Interaction,
+                                 error: Exception):
+        await report_error(interaction, error)
 
 
 async def setup(client: commands.Bot) -> None:
@@ -0,0 +1,109 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from core.quotas import MAX_RETENTION_POLICIES_PER_GUILD
+from core.retention import BACKFILL_LIMIT
+
+
+def describe_policy(policy) -> str:
+    limits = []
+    if policy.get("max_age") is not None:
+        hours = policy["max_age"] / 3600
+        limits.append(f"last {hours:g} hours")
+    if policy.get("max_count") is not None:
+        limits.append(f"last {policy['max_count']} messages")
+    return "Keep the " + " and the ".join(limits)
+
+
+class Retention(commands.Cog):
+    """Per-channel retention: keep only recent messages, continuously."""
+
+    def __init__(self, client: commands.Bot):
+        self.client = client
+        self.retention = client.retention
+
+    @app_commands.command(
+        name="retention_set",
+        description="Keep a channel trimmed to recent messages, continuously.")
+    @app_commands.describe(
+        channel="The channel to keep trimmed",
+        max_age_hours="Delete messages once they are this many hours old",
+        max_count="Keep at most this many of the newest messages")
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_messages=True)
+    async def retention_set(
+            self, interaction: discord.Interaction, channel: discord.TextChannel,
+            max_age_hours: app_commands.Range[int, 1, 24 * 365] | None = None,
+            max_count: app_commands.Range[int, 1, BACKFILL_LIMIT] | None = None):
+        if max_age_hours is None and max_count is None:
+            await interaction.response.send_message(
+                "Give max_age_hours, max_count or both.", ephemeral=True)
+            return
+        permissions = channel.permissions_for(channel.guild.me)
+        if not permissions.manage_messages or not permissions.read_message_history:
+            await interaction.response.send_message(
+                "I need Manage Messages and Read Message History in "
+                f"{channel.mention}.",
+                ephemeral=True)
+            return
+        existing = await self.retention.store.retention_policies(channel.guild.id)
+        if (len(existing) >= MAX_RETENTION_POLICIES_PER_GUILD
+                and all(policy["channel_id"] != channel.id for policy in existing)):
+            await interaction.response.send_message(
+                f"This server already has {MAX_RETENTION_POLICIES_PER_GUILD} "
+                "retention policies. Clear one before adding another.",
+                ephemeral=True)
+            return
+
+        policy = {
+            "guild_id": channel.guild.id,
+            "channel_id": channel.id,
+            "max_age": max_age_hours * 3600 if max_age_hours is not None else None,
+            "max_count": max_count,
+        }
+        await self.retention.set_policy(policy)
+        await interaction.response.send_message(
+            f"{describe_policy(policy)} in {channel.mention}. Older messages are "
+            "deleted a batch at a time as they expire.", ephemeral=True)
+
+    @app_commands.command(name="retention_clear",
+                          description="Stop trimming a channel.")
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_messages=True)
+    async def retention_clear(self, interaction: discord.Interaction,
+                              channel: discord.TextChannel):
+        if await self.retention.remove_policy(channel.id, interaction.guild.id):
+            message = f"Retention policy for {channel.mention} removed."
+        else:
+            message = f"{channel.mention} has no retention policy."
+        await interaction.response.send_message(message, ephemeral=True)
+
+    @app_commands.command(name="retention_list",
+                          description="Show this server's retention policies.")
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_messages=True)
+    async def retention_list(self, interaction: discord.Interaction):
+        policies = await self.retention.store.retention_policies(interaction.guild.id)
+        if not policies:
+            await interaction.response.send_message(
+                "This server has no retention policies.", ephemeral=True)
+            return
+        embed = discord.Embed(title="Retention Policies", color=discord.Color.blue())
+        # Discord caps embeds at 25 fields.
+        for policy in policies[:25]:
+            entry = self.retention.index.channels.get(policy["channel_id"])
+            tracked = f"\nTracking {len(entry)} messages" if entry is not None else ""
+            name = self.client.get_channel(policy["channel_id"]) or policy["channel_id"]
+            embed.add_field(name=f"#{name}",
+                            value=describe_policy(policy) + tracked, inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        await self.retention.remove_policy(channel.id)
+        self.retention.index.drop(channel.id)
+
+
+async def setup(client: commands.Bot) -> None:
+    await client.add_cog(Retention(client))
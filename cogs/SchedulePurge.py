@@ -1,128 +1,194 @@
-import json
-from datetime import datetime, timedelta, timezone
+import logging
+from datetime import datetime, timedelta
 
-import aiofiles
 import discord
-import pytz
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.ui import Select, View
 
+from core.filters import CONTENT_FILTER_OPTIONS, describe_filters, filter_spec
+from core.jobstore import job_timestamp, parse_scheduled_time
+from core.preview import describe_preview, preview_purge
+from core.quotas import job_quota_error
+from core.recurrence import DEFAULT_MISFIRE_LIMIT
+from core.rules import compile_rule
+from core.timezones import localize, resolve_timezone, to_wall_time
+from core.triggers import trigger_for
 
-class CancelView(View):
+SOURCE = "schedule"
 
-    def __init__(self, jobs, *args, **kwargs):
+log = logging.getLogger(__name__)
+
+
+# Discord caps embeds at 25 fields and selects at 25 options.
+PAGE_SIZE = 10
+
+
+def describe_job(job) -> str:
+    recurring = trigger_for(job).describe()
+    scheduled_time = parse_scheduled_time(job["scheduled_time"])
+    zone_name = job.get("timezone", "UTC")
+    local_time = to_wall_time(scheduled_time, resolve_timezone(zone_name))
+    scheduled_time = scheduled_time.strftime("%Y-%m-%d %H:%M:%S UTC")
+    if zone_name != "UTC":
+        scheduled_time += f" ({local_time:%Y-%m-%d %H:%M} {zone_name})"
+    job_info = (
+        f"Channel ID: {job['channel_id']}\n"
+        f"Scheduled Time: {scheduled_time}\n"
+        f"Messages to Purge: {job['amount']}\n"
+        f"Recurring: {recurring}"
+    )
+    if job.get("filters"):
+        job_info += f"\nFilters: {describe_filters(job['filters'])}"
+    misfire = job.get("last_misfire")
+    if misfire:
+        job_info += (f"\nLast Misfire: {misfire['missed']} missed, "
+                     f"{misfire['ran']} run ({misfire['policy']})")
+    return job_info
+
+
+class JobPageView(View):
+    """Pages through scheduled jobs, fetching one page per button press.
+
+    Pages are addressed by the (next_run_time, id) of the last job on the
+    previous page, so each press is a single indexed query.
+    """
+
+    def __init__(self, cog, guild_id, channel_id=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.cancel_select = Select(
-            placeholder="Select a job to cancel...",
-            options=[
-                discord.SelectOption(
-                    label=f"Job {index + 1}: Channel {job['channel_id']} at {job['scheduled_time']}",
-                    description=f"Limits: {job['amount']} messages",
-                    value=str(index)) for index, job in enumerate(jobs)
-            ])
+        self.cog = cog
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.cursors = [None]
+        self.jobs = []
+
+    async def load_page(self):
+        jobs = await self.cog.scheduler.list_jobs(self.guild_id, self.channel_id,
+                                                  after=self.cursors[-1],
+                                                  limit=PAGE_SIZE + 1)
+        self.jobs = jobs[:PAGE_SIZE]
+        self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = len(jobs) <= PAGE_SIZE
+
+    def render(self) -> discord.Embed:
+        embed = discord.Embed(title="Scheduled Purge Jobs",
+                              color=discord.Color.blue())
+        first = (len(self.cursors) - 1) * PAGE_SIZE + 1
+        for i, job in enumerate(self.jobs, start=first):
+            embed.add_field(name=f"Job {i}", value=describe_job(job), inline=False)
+        embed.set_footer(text=f"Page {len(self.cursors)}")
+        return embed
+
+    async def show(self, interaction: discord.Interaction):
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction,
+                            _button: discord.ui.Button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await self.load_page()
+        await self.show(interaction)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction,
+                        _button: discord.ui.Button):
+        if self.jobs:
+            last = self.jobs[-1]
+            self.cursors.append((job_timestamp(last), last["id"]))
+        await self.load_page()
+        await self.show(interaction)
+
+
+class CancelView(JobPageView):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cancel_select = Select(placeholder="Select a job to cancel...")
         self.cancel_select.callback = self.cancel_job
         self.add_item(self.cancel_select)
-        self.jobs = jobs
+
+    async def load_page(self):
+        await super().load_page()
+        first = (len(self.cursors) - 1) * PAGE_SIZE + 1
+        self.cancel_select.options = [
+            discord.SelectOption(
+                label=(f"Job {index}: Channel {job['channel_id']} "
+                       f"at {job['scheduled_time']}"),
+                description=f"Limits: {job['amount']} messages",
+                value=job["id"]) for index, job in enumerate(self.jobs, start=first)
+        ]
+        self.cancel_select.disabled = not self.jobs
+        if not self.jobs:
+            # A select needs at least one option even when disabled.
+            self.cancel_select.options = [
+                discord.SelectOption(label="No jobs on this page", value="none")]
 
     async def cancel_job(self, interaction: discord.Interaction):
-        job_index = int(self.cancel_select.values[0])
-        self.jobs.pop(job_index)
-        async with aiofiles.open("purgejobs.json", "w") as file:
-            await file.write(json.dumps(self.jobs, indent=4))
-        await interaction.response.send_message(
-            content="Job cancelled successfully.", ephemeral=True)
+        job_id = self.cancel_select.values[0]
+        if await self.cog.scheduler.remove_job(job_id, self.guild_id):
+            await interaction.response.send_message(
+                content="Job cancelled successfully.", ephemeral=True)
+        else:
+            await interaction.response.send_message(
+                content="That job has already run or been cancelled.", ephemeral=True)
 
 
 class SchedulePurge(commands.Cog):
 
     def __init__(self, client: commands.Bot):
         self.client = client
-        self.purge_check.start()
-
-    async def cog_unload(self):
-        self.purge_check.cancel()
+        self.scheduler = client.scheduler
 
     @app_commands.command(name="cancel_purge",
                           description="Cancel a scheduled purge job.")
-    async def cancel_purge(self, interaction: discord.Interaction):
+    @app_commands.describe(channel="Only show jobs for this channel")
+    async def cancel_purge(self, interaction: discord.Interaction,
+                           channel: discord.TextChannel | None = None):
+        if interaction.guild is None:
+            await interaction.response.send_message(
+                "This command can only be used within a server.", ephemeral=True)
+            return
         try:
-            async with aiofiles.open("purgejobs.json", "r") as file:
-                content = await file.read()
-                jobs = json.loads(content) if content else []
-
-            if jobs:
-                view = CancelView(jobs)
+            view = CancelView(self, interaction.guild.id,
+                              channel.id if channel else None)
+            await view.load_page()
+            if view.jobs:
                 await interaction.response.send_message(
-                    "Select a purge job to cancel:", view=view, ephemeral=True)
+                    "Select a purge job to cancel:", embed=view.render(),
+                    view=view, ephemeral=True)
             else:
                 await interaction.response.send_message(
                     "There are no scheduled purge jobs to cancel.", ephemeral=True)
-        except Exception as e:
-            print(f"Error in cancel_purge command: {e}")
+        except Exception:
+            log.exception("Error in cancel_purge command")
             await interaction.response.send_message(
                 "An error occurred while processing your request.", ephemeral=True)
 
-    async def update_missed_purge_jobs(self):
-        now = datetime.now(pytz.UTC)
-        updated_jobs = []
-        jobs_updated = False
-        try:
-            async with aiofiles.open("purgejobs.json", "r+") as file:
-                jobs = json.loads(await file.read())
-                for job in jobs:
-                    job_time = datetime.fromisoformat(
-                        job["scheduled_time"]).replace(tzinfo=pytz.UTC)
-                    if now >= job_time and job["recurrence"] != "none":
-                        intervals = {
-                            "daily": timedelta(days=1),
-                            "hourly": timedelta(hours=1),
-                            "by minute": timedelta(minutes=1),
-                            "weekly": timedelta(weeks=1),
-                            "biweekly": timedelta(weeks=2),
-                        }
-                        while now >= job_time:
-                            job_time += intervals[job["recurrence"]]
-                            jobs_updated = True
-                        job["scheduled_time"] = job_time.isoformat()
-                    updated_jobs.append(job)
-                if jobs_updated:
-                    await file.seek(0)
-                    await file.write(json.dumps(updated_jobs, indent=4))
-                    await file.truncate()
-        except Exception as e:
-            print(f"Error updating missed purge jobs: {e}")
-
     @app_commands.command(name="view_purge_jobs",
                           description="View all scheduled purge jobs.")
-    async def view_purge_jobs(self, interaction: discord.Interaction):
+    @app_commands.describe(channel="Only show jobs for this channel")
+    async def view_purge_jobs(self, interaction: discord.Interaction,
+                              channel: discord.TextChannel | None = None):
+        if interaction.guild is None:
+            await interaction.response.send_message(
+                "This command can only be used within a server.", ephemeral=True)
+            return
         try:
-            async with aiofiles.open("purgejobs.json", "r") as file:
-                content = await file.read()
-                jobs = json.loads(content) if content else []
+            view = JobPageView(self, interaction.guild.id,
+                               channel.id if channel else None)
+            await view.load_page()
 
-            if not jobs:
+            if not view.jobs:
                 await interaction.response.send_message(
                     "No scheduled purge jobs found.", ephemeral=True)
                 return
 
-            embed = discord.Embed(title="Scheduled Purge Jobs",
-                                  color=discord.Color.blue())
-            for i, job in enumerate(jobs, start=1):
-                scheduled_time = datetime.fromisoformat(
-                    job["scheduled_time"]).strftime("%Y-%m-%d %H:%M:%S UTC")
-                job_info = (
-                    f"Channel ID: {job['channel_id']}\n"
-                    f"Scheduled Time: {scheduled_time}\n"
-                    f"Messages to Purge: {job['amount']}\n"
-                    f"Recurring: {'Yes' if job.get('recurrence') != 'none' else 'No'} - {job['recurrence'].capitalize() if job.get('recurrence') != 'none' else ''}"
-                )
-                embed.add_field(name=f"Job {i}", value=job_info, inline=False)
-
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-
-        except Exception as e:
-            print(f"Error in view_purge_jobs command: {e}")
+            await interaction.response.send_message(embed=view.render(), view=view,
+                                                    ephemeral=True)
+
+        except Exception:
+            log.exception("Error in view_purge_jobs command")
             await interaction.response.send_message(
                 "An error occurred while fetching the purge jobs.", ephemeral=True)
 
@@ -135,7 +201,13 @@ class SchedulePurge(commands.Cog):
         date="The date for the purge (YYYY-MM-DD)",  # Will be replaced by automatic insertion
         time="The time for the purge (HH:MM)",
         message_limit="The maximum number of messages to purge",
-        recurrence="How often the purge should recur")
+        recurrence="How often the purge should recur",
+        rule=("Custom schedule instead of recurrence: cron ('0 3 * * 1-5') "
+              "or RRULE ('FREQ=MONTHLY;BYDAY=1MO;BYHOUR=3')"),
+        misfire="What to do with purges missed while the bot was offline",
+        misfire_limit="With misfire 'all', the most missed purges to run",
+        preview="Don't schedule yet; show what the purge would delete if it ran now",
+        **CONTENT_FILTER_OPTIONS)
     @app_commands.choices(date=[
     app_commands.Choice(name=datetime.now().strftime("%Y-%m-%d"),
                         value=datetime.now().strftime("%Y-%m-%d")),
@@ -155,76 +227,106 @@ class SchedulePurge(commands.Cog):
     app_commands.Choice(name="by minute", value="by minute"),
     app_commands.Choice(name="weekly", value="weekly"),
     app_commands.Choice(name="biweekly", value="biweekly"),
+], misfire=[
+    app_commands.Choice(name="skip", value="skip"),
+    app_commands.Choice(name="run once", value="once"),
+    app_commands.Choice(name="run all", value="all"),
 ])
     async def schedule_purge(self, interaction: discord.Interaction,
                              channel: discord.TextChannel, date: str, time: str,
-                             message_limit: int, recurrence: str):
+                             message_limit: int, recurrence: str,
+                             rule: str | None = None,
+                             misfire: str | None = None,
+                             misfire_limit: int = DEFAULT_MISFIRE_LIMIT,
+                             author: discord.Member | None = None,
+                             role: discord.Role | None = None,
+                             bots: bool = False, regex: str | None = None,
+                             attachments: bool = False, keep_pinned: bool = False,
+                             preview: bool = False):
         try:
-            scheduled_time = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
+            quota_error = await job_quota_error(self.scheduler.store, channel.guild.id,
+                                                message_limit)
+            if quota_error:
+                await interaction.response.send_message(quota_error, ephemeral=True)
+                return
+
+            # Date and time are the invoking user's wall clock (see
+            # /set_timezone). Jobs keep UTC for the timer plus the zone and
+            # wall time, so daily/weekly recurrences stay at that local time.
+            zone_name = self.client.preferences.get(interaction.user.id, "timezone",
+                                                    "UTC")
+            tz = resolve_timezone(zone_name)
+            wall_time = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
+            scheduled_time = localize(wall_time, tz)
 
             new_job = {
+                "guild_id": channel.guild.id,
                 "channel_id": channel.id,
                 "scheduled_time": scheduled_time.isoformat(),
+                "timezone": zone_name,
+                "local_time": wall_time.strftime("%H:%M"),
                 "amount": message_limit,
+                "trigger": "date" if recurrence == "none" else "interval",
                 "recurrence": recurrence,
+                "misfire_limit": misfire_limit,
             }
+            if rule:
+                try:
+                    # First occurrence at or after the requested date and time.
+                    scheduled_time = compile_rule(rule).next_fire(
+                        scheduled_time - timedelta(minutes=1), tz)
+                except ValueError as e:
+                    await interaction.response.send_message(
+                        f"Invalid schedule rule: {e}", ephemeral=True)
+                    return
+                new_job.update(rule=rule, trigger="calendar", recurrence="custom",
+                               scheduled_time=scheduled_time.isoformat())
+            if misfire:
+                new_job["misfire"] = misfire
+            try:
+                # With filters, message_limit counts matching messages.
+                filters = filter_spec(author=author, role=role, bots=bots, regex=regex,
+                                      attachments=attachments, keep_pinned=keep_pinned,
+                                      message_content=self.client.intents.message_content)
+            except ValueError as e:
+                await interaction.response.send_message(f"Invalid filter: {e}",
+                                                        ephemeral=True)
+                return
+            if filters:
+                new_job["filters"] = filters
+
+            if preview:
+                await self.preview_job(interaction, channel, new_job)
+                return
 
-            async with aiofiles.open("purgejobs.json", "r+") as file:
-                content = await file.read()
-                jobs = json.loads(content) if content else []
-                jobs.append(new_job)
-                await file.seek(0)
-                await file.write(json.dumps(jobs, indent=4))
-                await file.truncate()
+            await self.scheduler.add_job(new_job, SOURCE)
 
             await interaction.response.send_message("Purge scheduled successfully.",
                                                     ephemeral=True)
-        except Exception as e:
-            print(f"Error in schedule_purge command: {e}")
-            await interaction.response.send_message(
-                "An error occurred while scheduling the purge.", ephemeral=True)
-
-    @tasks.loop(seconds=60)
-    async def purge_check(self):
-        """
-        Adjusted function to only update the scheduled time for the next purge
-        rather than executing the past due purges.
-        """
-        try:
-            now = datetime.now(timezone.utc)
-            async with aiofiles.open("purgejobs.json", "r+") as file:
-                content = await file.read()
-                jobs = json.loads(content) if content else []
-                jobs_to_keep = []
-                for job in jobs:
-                    job_time = datetime.fromisoformat(
-                        job["scheduled_time"]).replace(tzinfo=timezone.utc)
-                    if now >= job_time and job["recurrence"] != "none":
-                        # Update the job's scheduled time without purging
-                        intervals = {
-                            "daily": timedelta(days=1),
-                            "hourly": timedelta(hours=1),
-                            "by minute": timedelta(minutes=1),
-                            "weekly": timedelta(weeks=1),
-                            "biweekly": timedelta(weeks=2),
-                        }
-                        while now >= job_time:
-                            job_time += intervals[job["recurrence"]]
-                        job["scheduled_time"] = job_time.isoformat()
-
-                    jobs_to_keep.append(job)  # Re-add the job with the updated time
-
-                await file.seek(0)
-                await file.write(json.dumps(jobs_to_keep, indent=4))
-                await file.truncate()
-
-        except Exception as e:
-            print(f"Error in purge_check task: {e}")
-
-    @purge_check.before_loop
-    async def before_purge_check(self):
-        await self.client.wait_until_ready()
+        except Exception:
+            log.exception("Error in schedule_purge command")
+            if interaction.response.is_done():
+                await interaction.followup.send(
+                    "An error occurred while previewing the purge.", ephemeral=True)
+            else:
+                await interaction.response.send_message(
+                    "An error occurred while scheduling the purge.", ephemeral=True)
 
+    async def preview_job(self, interaction: discord.Interaction,
+                          channel: discord.TextChannel, job):
+        """Show what ``job`` would delete if it fired now, without scheduling it."""
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        # No history cache: the job should purge what is there when it fires.
+        preview = await preview_purge(self.scheduler.store, channel, job["amount"],
+                                      filters=job.get("filters"),
+                                      index=self.client.message_index)
+        embed = discord.Embed(title="Scheduled purge preview",
+                              description=describe_preview(preview),
+                              color=discord.Color.blue())
+        embed.add_field(name="Job", value=describe_job(job), inline=False)
+        embed.set_footer(text="Counted as if it ran now. Run the command again without "
+                              "preview to schedule it.")
+        await interaction.followup.send(embed=embed, ephemeral=True)
 
 async def setup(client: commands.Bot) -> None:
-    await client.add_cog(SchedulePurge(client))
\ No newline at end of file
+    await client.add_cog(SchedulePurge(client))
@@ -1,4 +1,3 @@
-import json
 import discord
 from discord import app_commands
 from discord.ext import commands
@@ -52,20 +51,10 @@ class TimezoneSelect(Select):
             self.add_option(label=tz, value=tz)
 
     async def callback(self, interaction: discord.Interaction):
-        # On timezone selection, update the usertimezones.json file
-        user_id = str(interaction.user.id)
+        # On timezone selection, update the user's preferences; the store
+        # persists them in the background
         timezone = self.values[0]
-
-        try:
-            with open('usertimezones.json', 'r') as file:
-                user_timezones = json.load(file)
-        except FileNotFoundError:
-            user_timezones = {}
-
-        user_timezones[user_id] = timezone
-
-        with open('usertimezones.json', 'w') as file:
-            json.dump(user_timezones, file, indent=4)
+        interaction.client.preferences.set(interaction.user.id, "timezone", timezone)
 
         await interaction.response.send_message(f"Your timezone has been set to {timezone}.", ephemeral=True)
 
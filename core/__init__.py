@@ -0,0 +1 @@
+# Shared building blocks used by the purge cogs (timers, stores, executors).
@@ -0,0 +1,41 @@
+import hashlib
+import inspect
+import json
+
+# Meta key holding the hash of the last command tree synced to Discord.
+TREE_HASH_KEY = "command_tree_hash"
+
+
+def tree_hash(tree) -> str:
+    """A stable hash of the global slash command payloads.
+
+    This is exactly what ``tree.sync()`` would upload, so the hash changes
+    whenever a command, option, description or choice does.
+    """
+    payload = sorted(
+        (_command_payload(command, tree) for command in tree.get_commands()),
+        key=lambda command: (command.get("type", 1), command["name"]))
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _command_payload(command, tree) -> dict:
+    # discord.py 2.4 added the tree argument; 2.3 (the pinned version) takes none.
+    if "tree" in inspect.signature(command.to_dict).parameters:
+        return command.to_dict(tree)
+    return command.to_dict()
+
+
+async def sync_if_changed(tree, store):
+    """Sync the global command tree only if it changed since the last sync.
+
+    Returns the synced commands, or None when Discord already has this
+    tree. The hash lives in the shared job store, so with several shard
+    processes only the first to start after a change syncs.
+    """
+    current = tree_hash(tree)
+    if await store.get_meta(TREE_HASH_KEY) == current:
+        return None
+    synced = await tree.sync()
+    await store.set_meta(TREE_HASH_KEY, current)
+    return synced
@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+from collections import deque
+
+import discord
+
+from core.ratelimit import RateLimiter
+
+DEFAULT_WORKERS = 8
+
+
+class PurgeExecutor:
+    """Bounded worker pool that runs purge jobs keyed by channel.
+
+    Jobs for different channels run concurrently, up to ``workers`` at a
+    time; jobs for the same channel run one after another in submission
+    order, because they share Discord's per-channel rate-limit buckets and
+    would only contend with each other.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS,
+                 limiter: RateLimiter | None = None):
+        self.workers = workers
+        self.limiter = limiter or RateLimiter()
+        self._pending = {}
+        self._ready = asyncio.Queue()
+        self._tasks = []
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._pending.values())
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker())
+                           for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def submit(self, channel_id: int, fn, *args, **kwargs) -> asyncio.Future:
+        """Queue ``fn(*args, **kwargs)`` behind earlier work for ``channel_id``."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._pending.get(channel_id)
+        if queue is None:
+            # The channel is neither queued nor running: make it ready.
+            queue = self._pending[channel_id] = deque()
+            self._ready.put_nowait(channel_id)
+        # Run it in the submitter's context so its logs keep their
+        # correlation id (see core.logs).
+        queue.append((fn, args, kwargs, future, contextvars.copy_context()))
+        return future
+
+    async def _worker(self):
+        while True:
+            channel_id = await self._ready.get()
+            queue = self._pending[channel_id]
+            fn, args, kwargs, future, context = queue.popleft()
+            try:
+                if not future.cancelled():
+                    result = await context.run(asyncio.create_task,
+                                               self._run(channel_id, fn, args, kwargs))
+                    if not future.cancelled():
+                        future.set_result(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                # Re-queue at the back so one busy channel can't starve the
+                # rest; a channel is only ever held by one worker.
+                if queue:
+                    self._ready.put_nowait(channel_id)
+                else:
+                    del self._pending[channel_id]
+                    self.limiter.forget(channel_id)
+
+    async def _run(self, channel_id, fn, args, kwargs):
+        await self.limiter.acquire("purge", channel_id)
+        try:
+            return await fn(*args, **kwargs)
+        except discord.RateLimited as e:
+            # discord.py gives up instead of sleeping for very long limits;
+            # hold the channel back and let the caller decide to retry.
+            self.limiter.penalize("purge", channel_id, e.retry_after)
+            raise
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self.limiter.penalize("purge", channel_id, 1.0, is_global=True)
+            raise
@@ -0,0 +1,227 @@
+import re
+
+import discord
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+# Filters travel with jobs and purge runs as plain dicts of these keys,
+# so they survive the job store and a resume. before/after are snowflakes.
+FILTER_KEYS = ("author", "role", "bots", "before", "after", "regex",
+               "attachments", "keep_pinned")
+MAX_PATTERN_LENGTH = 200
+# Filters that read message content, which the gateway only sends with the
+# privileged message content intent.
+CONTENT_FILTERS = ("regex", "attachments")
+# Messages a filtered purge reads at most when nothing else bounds it, so
+# a filter that rarely matches can't walk a channel's entire history.
+FILTERED_SCAN_LIMIT = 5_000
+
+# Slash command option descriptions, shared by the purge commands.
+# Scheduled purges take the content filters only; a fixed time window
+# makes no sense for a purge that recurs.
+CONTENT_FILTER_OPTIONS = {
+    "author": "Only delete messages from this member",
+    "role": "Only delete messages from members with this role",
+    "bots": "Only delete messages from bots",
+    "regex": ("Only delete messages whose text matches this pattern "
+              "(case-insensitive, one repeat at most)"),
+    "attachments": "Only delete messages with attachments",
+    "keep_pinned": "Don't delete pinned messages",
+}
+FILTER_OPTIONS = {
+    **CONTENT_FILTER_OPTIONS,
+    "after": ("Only delete messages sent after this time "
+              "(YYYY-MM-DD HH:MM, your timezone)"),
+    "before": ("Only delete messages sent before this time "
+               "(YYYY-MM-DD HH:MM, your timezone)"),
+}
+
+
+class MessageFilter:
+    """A filter spec compiled into a predicate over history messages.
+
+    The cheap attribute checks run first and the regex last, so most
+    messages are rejected without touching their content. Role checks
+    need the author's roles, which messages from the history API don't
+    carry. Those are fetched once per author and cached, so compile one
+    filter per purge run.
+
+    ``before``/``after`` don't take part in the predicate. ``bounds``
+    folds them into the history scan so messages outside the window are
+    never fetched at all.
+    """
+
+    __slots__ = ("spec", "before", "after", "role_id", "_checks", "_roles")
+
+    def __init__(self, spec: dict):
+        unknown = set(spec) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+        self.spec = spec
+        self.before = spec.get("before")
+        self.after = spec.get("after")
+        if (self.before is not None and self.after is not None
+                and self.after >= self.before):
+            raise ValueError("The 'after' time must be earlier than the 'before' time.")
+        self.role_id = spec.get("role")
+        self._roles = {}
+        checks = []
+        if spec.get("keep_pinned"):
+            checks.append(lambda message: not message.pinned)
+        if spec.get("bots"):
+            checks.append(lambda message: message.author.bot)
+        if spec.get("author") is not None:
+            author_id = spec["author"]
+            checks.append(lambda message: message.author.id == author_id)
+        if spec.get("attachments"):
+            checks.append(lambda message: bool(message.attachments))
+        if spec.get("regex"):
+            pattern = compile_pattern(spec["regex"])
+            checks.append(lambda message: pattern.search(message.content) is not None)
+        self._checks = tuple(checks)
+
+    @property
+    def selective(self) -> bool:
+        """Whether the filter can reject messages inside its time window."""
+        return bool(self._checks) or self.role_id is not None
+
+    def bounds(self, before=None, after=None):
+        """Narrow a scan's ``before``/``after`` snowflakes to this filter's window."""
+        if self.before is not None:
+            before = self.before if before is None else min(before, self.before)
+        if self.after is not None:
+            after = self.after if after is None else max(after, self.after)
+        return before, after
+
+    async def matches(self, message: discord.Message) -> bool:
+        for check in self._checks:
+            if not check(message):
+                return False
+        if self.role_id is not None:
+            return self.role_id in await self._author_roles(message)
+        return True
+
+    async def _author_roles(self, message):
+        author = message.author
+        roles = self._roles.get(author.id)
+        if roles is None:
+            if isinstance(author, discord.Member):
+                member = author
+            else:
+                try:
+                    member = await message.guild.fetch_member(author.id)
+                except discord.NotFound:
+                    member = None  # Left the server; no roles to match.
+            roles = self._roles[author.id] = (
+                frozenset(role.id for role in member.roles) if member else frozenset())
+        return roles
+
+
+def compile_pattern(text: str) -> re.Pattern:
+    """Compile a user's pattern, refusing any that could backtrack for long.
+
+    Patterns run on the event loop, and ``re`` holds the GIL while it
+    matches, so a worker thread wouldn't help. Instead a pattern may repeat
+    only once (``*``, ``+``, ``?`` or ``{m,n}``), not inside alternatives,
+    and without backreferences. That keeps a search quadratic in the
+    message length at worst.
+    """
+    if len(text) > MAX_PATTERN_LENGTH:
+        raise ValueError(f"Patterns are limited to {MAX_PATTERN_LENGTH} characters.")
+    try:
+        parsed = sre_parse.parse(text, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid pattern: {e}") from None
+    if _repeats(parsed, nested=False) > 1:
+        raise ValueError("Patterns may only repeat once (one *, +, ? or {m,n}).")
+    return re.compile(text, re.IGNORECASE)
+
+
+def _repeats(items, nested: bool) -> int:
+    """Variable repeats in a parsed pattern; raises ValueError on nested ones."""
+    count = 0
+    for op, av in items:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            raise ValueError("Patterns can't use backreferences.")
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, high, body = av
+            variable = low != high
+            if variable and nested:
+                raise ValueError("Patterns can't repeat inside a repeat.")
+            count += variable + _repeats(body, nested or variable)
+        elif op is sre_parse.BRANCH:
+            if nested:
+                raise ValueError("Patterns can't repeat alternatives.")
+            count += sum(_repeats(branch, nested) for branch in av[1])
+        elif op is sre_parse.SUBPATTERN:
+            count += _repeats(av[-1], nested)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            count += _repeats(av[1], nested)
+    return count
+
+
+def filter_spec(*, author=None, role=None, bots=False, before=None, after=None,
+                regex=None, attachments=False, keep_pinned=False,
+                message_content: bool = True) -> dict | None:
+    """Build a filter spec from command options, or None if none were given.
+
+    Objects become ids and datetimes become snowflakes. Raises ValueError
+    (with a message fit for the user) if the filters don't compile, or if
+    they need content the bot doesn't receive: without ``message_content``
+    (the bot's intent), every message reads as empty, and a pattern like
+    ``.*`` would match all of them.
+    """
+    spec = {
+        "author": getattr(author, "id", author),
+        "role": getattr(role, "id", role),
+        "bots": bots or None,
+        "before": _snowflake(before, high=False),
+        "after": _snowflake(after, high=True),
+        "regex": regex or None,
+        "attachments": attachments or None,
+        "keep_pinned": keep_pinned or None,
+    }
+    spec = {key: value for key, value in spec.items() if value is not None}
+    if not spec:
+        return None
+    if not message_content and any(key in spec for key in CONTENT_FILTERS):
+        raise ValueError("The regex and attachments filters need the message content "
+                         "intent, which this bot runs without.")
+    MessageFilter(spec)
+    return spec
+
+
+def describe_filters(spec: dict | None) -> str:
+    if not spec:
+        return "none"
+    parts = []
+    if "author" in spec:
+        parts.append(f"author <@{spec['author']}>")
+    if "role" in spec:
+        parts.append(f"role <@&{spec['role']}>")
+    if spec.get("bots"):
+        parts.append("bots only")
+    if "after" in spec:
+        parts.append(f"after {_format_snowflake(spec['after'])}")
+    if "before" in spec:
+        parts.append(f"before {_format_snowflake(spec['before'])}")
+    if spec.get("regex"):
+        parts.append(f"matching `{spec['regex']}`")
+    if spec.get("attachments"):
+        parts.append("with attachments")
+    if spec.get("keep_pinned"):
+        parts.append("keeping pinned")
+    return ", ".join(parts)
+
+
+def _format_snowflake(snowflake: int) -> str:
+    return discord.utils.format_dt(discord.utils.snowflake_time(snowflake))
+
+
+def _snowflake(value, high):
+    if value is None or isinstance(value, int):
+        return value
+    return discord.utils.time_snowflake(value, high=high)
@@ -0,0 +1,581 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from core.metrics import STORE_LATENCY
+
+DEFAULT_PATH = "purgejobs.sqlite"
+
+# Each entry upgrades the schema by one version (tracked in PRAGMA
+# user_version), so existing databases are migrated in place.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS purge_jobs (
+        id TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        channel_id INTEGER NOT NULL,
+        next_run_time REAL NOT NULL,
+        job_state TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_purge_jobs_next_run_time
+        ON purge_jobs (next_run_time);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS purge_runs (
+        id TEXT PRIMARY KEY,
+        channel_id INTEGER NOT NULL,
+        params TEXT NOT NULL,
+        last_message_id INTEGER,
+        scanned INTEGER NOT NULL DEFAULT 0,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_purge_jobs_channel
+        ON purge_jobs (channel_id, next_run_time, id);
+    """,
+    """
+    ALTER TABLE purge_jobs ADD COLUMN guild_id INTEGER;
+    CREATE INDEX IF NOT EXISTS ix_purge_jobs_guild
+        ON purge_jobs (guild_id, next_run_time, id);
+    CREATE TABLE IF NOT EXISTS guild_usage (
+        guild_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, day)
+    );
+    """,
+    """
+    ALTER TABLE purge_runs ADD COLUMN guild_id INTEGER;
+    """,
+    """
+    ALTER TABLE purge_jobs ADD COLUMN lease_owner TEXT;
+    ALTER TABLE purge_jobs ADD COLUMN lease_expires REAL;
+    ALTER TABLE purge_runs ADD COLUMN lease_owner TEXT;
+    ALTER TABLE purge_runs ADD COLUMN lease_expires REAL;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS retention_policies (
+        channel_id INTEGER PRIMARY KEY,
+        guild_id INTEGER NOT NULL,
+        max_age REAL,
+        max_count INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS ix_retention_policies_guild
+        ON retention_policies (guild_id);
+    """,
+    """
+    ALTER TABLE retention_policies ADD COLUMN lease_owner TEXT;
+    ALTER TABLE retention_policies ADD COLUMN lease_expires REAL;
+    """,
+]
+
+# Seconds a claim on a job, purge run or retention policy stays valid
+# without renewal. A replica that dies leaves its leases to expire, after
+# which another replica picks the work up.
+LEASE_TTL = 60.0
+
+
+class LeaseLost(Exception):
+    """Another replica took over a purge run this process was running."""
+
+
+def parse_scheduled_time(value: str) -> datetime:
+    # Older jobs were stored as naive ISO strings; those are treated as UTC.
+    scheduled_time = datetime.fromisoformat(value)
+    if scheduled_time.tzinfo is None:
+        scheduled_time = scheduled_time.replace(tzinfo=timezone.utc)
+    return scheduled_time
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def job_timestamp(job) -> float:
+    return parse_scheduled_time(job["scheduled_time"]).timestamp()
+
+
+class JobStore:
+    """SQLite-backed purge job store.
+
+    Jobs are plain dicts, stored one row each with the indexed columns
+    (``guild_id``, ``channel_id``, ``next_run_time``) pulled out and the
+    full dict kept as JSON in ``job_state``. All database work runs on a
+    single dedicated thread so the event loop never blocks on disk I/O, and
+    the connection uses WAL so readers never wait on a writer.
+
+    Several bot processes may share one store. Due jobs and purge runs are
+    claimed with a lease held by ``owner`` (unique per process), so each is
+    worked on by one process at a time; see ``claim_job`` and ``claim_run``.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, owner: str | None = None):
+        self.path = path
+        self.owner = owner or (
+            f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix="jobstore")
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            STORE_LATENCY.observe(time.perf_counter() - started,
+                                  operation=fn.__name__.lstrip("_"))
+
+    async def open(self):
+        if self._conn is None:
+            await self._call(self._open)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._call(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, isolation_level=None,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.executescript(f"BEGIN IMMEDIATE;\n{script}\n"
+                               f"PRAGMA user_version={number};\nCOMMIT;")
+        self._conn = conn
+
+    @staticmethod
+    def _row_values(job, source):
+        return (job["id"], source, job.get("guild_id"), job["channel_id"],
+                job_timestamp(job), json.dumps(job))
+
+    # -- Writes: one row per operation ------------------------------------
+
+    async def add_job(self, job, source: str):
+        job.setdefault("id", uuid.uuid4().hex)
+        await self._call(self._add_job, self._row_values(job, source))
+        return job
+
+    def _add_job(self, values):
+        self._conn.execute(
+            "INSERT INTO purge_jobs"
+            " (id, source, guild_id, channel_id, next_run_time, job_state)"
+            " VALUES (?, ?, ?, ?, ?, ?)", values)
+
+    async def update_job(self, job) -> bool:
+        """Persist changes to an existing job and release this process's lease on it.
+
+        Returns False if the job was removed, or is leased to another
+        replica: ours expired and it claimed the job meanwhile.
+        """
+        return await self._call(self._update_job, job_timestamp(job),
+                                json.dumps(job), job["id"])
+
+    def _update_job(self, next_run_time, state, job_id):
+        cursor = self._conn.execute(
+            "UPDATE purge_jobs SET next_run_time = ?, job_state = ?,"
+            " lease_owner = NULL, lease_expires = NULL"
+            " WHERE id = ? AND (lease_owner = ? OR lease_owner IS NULL)",
+            (next_run_time, state, job_id, self.owner))
+        return cursor.rowcount > 0
+
+    async def claim_job(self, job_id):
+        """Lease a due job to this process, or None if it can't be claimed.
+
+        Only a job whose next run time has passed and that no replica holds
+        an unexpired lease on can be claimed, so when several processes'
+        timers fire the same job exactly one of them gets it. The lease is
+        released by ``update_job`` (or ``remove_job``) once the job has been
+        advanced.
+        """
+        return await self._call(self._claim_job, job_id)
+
+    def _claim_job(self, job_id):
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = self._conn.execute(
+                "UPDATE purge_jobs SET lease_owner = ?, lease_expires = ?"
+                " WHERE id = ? AND next_run_time <= ?"
+                " AND (lease_expires IS NULL OR lease_expires < ?)",
+                (self.owner, now + LEASE_TTL, job_id, now, now))
+            row = None
+            if cursor.rowcount:
+                row = self._conn.execute(
+                    "SELECT job_state FROM purge_jobs WHERE id = ?",
+                    (job_id,)).fetchone()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return json.loads(row["job_state"]) if row else None
+
+    async def renew_leases(self):
+        """Heartbeat: extend every lease this process holds."""
+        await self._call(self._renew_leases)
+
+    def _renew_leases(self):
+        expires = time.time() + LEASE_TTL
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("purge_jobs", "purge_runs", "retention_policies"):
+                self._conn.execute(
+                    f"UPDATE {table} SET lease_expires = ? WHERE lease_owner = ?",
+                    (expires, self.owner))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    async def remove_job(self, job_id, guild_id: int | None = None) -> bool:
+        """Delete a job; with ``guild_id``, only if it belongs to that guild."""
+        return await self._call(self._remove_job, job_id, guild_id)
+
+    def _remove_job(self, job_id, guild_id):
+        if guild_id is None:
+            cursor = self._conn.execute("DELETE FROM purge_jobs WHERE id = ?",
+                                        (job_id,))
+        else:
+            cursor = self._conn.execute(
+                "DELETE FROM purge_jobs WHERE id = ? AND guild_id = ?",
+                (job_id, guild_id))
+        return cursor.rowcount > 0
+
+    # -- Reads ------------------------------------------------------------
+
+    async def get_job(self, job_id):
+        return await self._call(self._get_job, job_id)
+
+    def _get_job(self, job_id):
+        row = self._conn.execute(
+            "SELECT job_state FROM purge_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["job_state"]) if row else None
+
+    async def all_jobs(self):
+        return await self._call(self._all_jobs)
+
+    def _all_jobs(self):
+        rows = self._conn.execute(
+            "SELECT job_state FROM purge_jobs ORDER BY next_run_time")
+        return [json.loads(row["job_state"]) for row in rows]
+
+    async def list_jobs(self, guild_id: int, channel_id: int | None = None,
+                        after=None, limit: int = 10):
+        """One page of a guild's jobs, ordered by next run time.
+
+        ``after`` is the ``(next_run_time, id)`` of the last job on the
+        previous page (keyset pagination). Both the guild and channel
+        variants walk an index in order, so fetching any page costs the
+        same no matter how many jobs exist in this or other guilds.
+        """
+        return await self._call(self._list_jobs, guild_id, channel_id,
+                                after, limit)
+
+    def _list_jobs(self, guild_id, channel_id, after, limit):
+        if channel_id is None:
+            query = ("SELECT job_state FROM purge_jobs"
+                     " WHERE guild_id = ?")
+            params = [guild_id]
+        else:
+            query = ("SELECT job_state FROM purge_jobs"
+                     " WHERE channel_id = ? AND guild_id = ?")
+            params = [channel_id, guild_id]
+        if after is not None:
+            query += " AND (next_run_time, id) > (?, ?)"
+            params.extend(after)
+        query += " ORDER BY next_run_time, id LIMIT ?"
+        params.append(limit)
+        return [json.loads(row["job_state"])
+                for row in self._conn.execute(query, params)]
+
+    async def job_times(self):
+        """``(id, guild_id, next_run_time)`` for every job, for timer resyncs."""
+        return await self._call(self._job_times)
+
+    def _job_times(self):
+        return self._conn.execute(
+            "SELECT id, guild_id, next_run_time FROM purge_jobs").fetchall()
+
+    async def count_guild_jobs(self, guild_id: int) -> int:
+        return await self._call(self._count_guild_jobs, guild_id)
+
+    def _count_guild_jobs(self, guild_id):
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM purge_jobs WHERE guild_id = ?",
+            (guild_id,)).fetchone()[0]
+
+    async def backfill_guild_ids(self, resolve_guild):
+        """Fill in ``guild_id`` for jobs stored before jobs were guild-keyed.
+
+        ``resolve_guild`` maps a channel id to its guild id, or None if the
+        channel is no longer visible (those rows are left for a later try).
+        """
+        rows = await self._call(self._jobs_missing_guild)
+        updates = []
+        for job_id, channel_id, state in rows:
+            guild_id = resolve_guild(channel_id)
+            if guild_id is not None:
+                job = json.loads(state)
+                job["guild_id"] = guild_id
+                updates.append((guild_id, json.dumps(job), job_id))
+        if updates:
+            await self._call(self._set_guild_ids, updates)
+        return len(updates)
+
+    def _jobs_missing_guild(self):
+        return self._conn.execute(
+            "SELECT id, channel_id, job_state FROM purge_jobs"
+            " WHERE guild_id IS NULL").fetchall()
+
+    def _set_guild_ids(self, updates):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(
+                "UPDATE purge_jobs SET guild_id = ?, job_state = ? WHERE id = ?",
+                updates)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    # -- Purge run checkpoints --------------------------------------------
+    # A row exists only while a run is in flight; finished runs are removed.
+    # The process running it holds a lease, renewed by every checkpoint and
+    # by renew_leases.
+
+    async def start_run(self, run_id, guild_id, channel_id, params):
+        await self._call(self._start_run, run_id, guild_id, channel_id,
+                         json.dumps(params))
+
+    def _start_run(self, run_id, guild_id, channel_id, params):
+        # A resumed run already has its row (claimed with claim_run).
+        self._conn.execute(
+            "INSERT INTO purge_runs"
+            " (id, guild_id, channel_id, params, updated_at, lease_owner,"
+            " lease_expires)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO NOTHING",
+            (run_id, guild_id, channel_id, params, time.time(), self.owner,
+             time.time() + LEASE_TTL))
+
+    async def checkpoint_run(self, run_id, last_message_id, scanned, deleted) -> bool:
+        """Record progress; False if another process has taken the run over."""
+        return await self._call(self._checkpoint_run, run_id, last_message_id,
+                                scanned, deleted)
+
+    def _checkpoint_run(self, run_id, last_message_id, scanned, deleted):
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE purge_runs SET last_message_id = ?, scanned = ?, deleted = ?,"
+            " updated_at = ?, lease_expires = ? WHERE id = ? AND lease_owner = ?",
+            (last_message_id, scanned, deleted, now, now + LEASE_TTL, run_id,
+             self.owner))
+        return cursor.rowcount > 0
+
+    async def finish_run(self, run_id):
+        await self._call(self._finish_run, run_id)
+
+    def _finish_run(self, run_id):
+        self._conn.execute(
+            "DELETE FROM purge_runs WHERE id = ?"
+            " AND (lease_owner = ? OR lease_owner IS NULL)", (run_id, self.owner))
+
+    async def orphaned_runs(self):
+        """In-flight runs no live process holds a lease on, oldest first.
+
+        These were interrupted by a shutdown or crash and can be resumed
+        from their checkpoint once claimed with ``claim_run``.
+        """
+        return await self._call(self._orphaned_runs)
+
+    def _orphaned_runs(self):
+        rows = self._conn.execute(
+            "SELECT id, guild_id, channel_id, params, last_message_id, scanned,"
+            " deleted FROM purge_runs"
+            " WHERE lease_expires IS NULL OR lease_expires < ?"
+            " ORDER BY updated_at", (time.time(),))
+        return [dict(row, params=json.loads(row["params"])) for row in rows]
+
+    async def claim_run(self, run_id) -> bool:
+        return await self._call(self._claim_run, run_id)
+
+    def _claim_run(self, run_id):
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE purge_runs SET lease_owner = ?, lease_expires = ?"
+            " WHERE id = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+            (self.owner, now + LEASE_TTL, run_id, now))
+        return cursor.rowcount > 0
+
+    # -- Per-guild purge volume -------------------------------------------
+
+    async def guild_usage(self, guild_id: int) -> int:
+        """Messages deleted in ``guild_id`` so far today (UTC)."""
+        return await self._call(self._guild_usage, guild_id)
+
+    def _guild_usage(self, guild_id):
+        row = self._conn.execute(
+            "SELECT deleted FROM guild_usage WHERE guild_id = ? AND day = ?",
+            (guild_id, _today())).fetchone()
+        return row["deleted"] if row else 0
+
+    async def add_guild_usage(self, guild_id: int, deleted: int):
+        if deleted:
+            await self._call(self._add_guild_usage, guild_id, deleted)
+
+    def _add_guild_usage(self, guild_id, deleted):
+        self._conn.execute(
+            "INSERT INTO guild_usage (guild_id, day, deleted) VALUES (?, ?, ?)"
+            " ON CONFLICT (guild_id, day) DO UPDATE"
+            " SET deleted = deleted + excluded.deleted",
+            (guild_id, _today(), deleted))
+
+    # -- Retention policies -----------------------------------------------
+    # Policies are dicts of channel_id, guild_id, max_age (seconds) and
+    # max_count; either limit may be None.
+
+    async def set_retention(self, policy):
+        await self._call(self._set_retention, policy["channel_id"], policy["guild_id"],
+                         policy.get("max_age"), policy.get("max_count"))
+
+    def _set_retention(self, channel_id, guild_id, max_age, max_count):
+        self._conn.execute(
+            "INSERT INTO retention_policies (channel_id, guild_id, max_age, max_count)"
+            " VALUES (?, ?, ?, ?) ON CONFLICT (channel_id) DO UPDATE"
+            " SET max_age = excluded.max_age, max_count = excluded.max_count",
+            (channel_id, guild_id, max_age, max_count))
+
+    async def remove_retention(self, channel_id: int,
+                               guild_id: int | None = None) -> bool:
+        """Delete a policy; with ``guild_id``, only if it belongs to that guild."""
+        return await self._call(self._remove_retention, channel_id, guild_id)
+
+    def _remove_retention(self, channel_id, guild_id):
+        if guild_id is None:
+            cursor = self._conn.execute(
+                "DELETE FROM retention_policies WHERE channel_id = ?", (channel_id,))
+        else:
+            cursor = self._conn.execute(
+                "DELETE FROM retention_policies WHERE channel_id = ? AND guild_id = ?",
+                (channel_id, guild_id))
+        return cursor.rowcount > 0
+
+    async def retention_policies(self, guild_id: int | None = None):
+        """Every policy, or only ``guild_id``'s."""
+        return await self._call(self._retention_policies, guild_id)
+
+    def _retention_policies(self, guild_id):
+        query = ("SELECT channel_id, guild_id, max_age, max_count"
+                 " FROM retention_policies")
+        if guild_id is None:
+            rows = self._conn.execute(query)
+        else:
+            rows = self._conn.execute(query + " WHERE guild_id = ?", (guild_id,))
+        return [dict(row) for row in rows]
+
+    async def claim_retention(self, channel_ids) -> set:
+        """Lease the policies of ``channel_ids`` to this process, renewing ours.
+
+        Returns the channel ids this process now holds. The rest are leased
+        to another replica, which sweeps them until its lease expires.
+        """
+        return await self._call(self._claim_retention, list(channel_ids))
+
+    def _claim_retention(self, channel_ids):
+        now = time.time()
+        held = set()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Batched to stay under SQLite's limit on query parameters.
+            for start in range(0, len(channel_ids), 500):
+                chunk = channel_ids[start:start + 500]
+                marks = ", ".join("?" * len(chunk))
+                self._conn.execute(
+                    "UPDATE retention_policies SET lease_owner = ?, lease_expires = ?"
+                    f" WHERE channel_id IN ({marks}) AND (lease_owner = ?"
+                    " OR lease_expires IS NULL OR lease_expires < ?)",
+                    (self.owner, now + LEASE_TTL, *chunk, self.owner, now))
+                held.update(row["channel_id"] for row in self._conn.execute(
+                    "SELECT channel_id FROM retention_policies"
+                    f" WHERE channel_id IN ({marks}) AND lease_owner = ?",
+                    (*chunk, self.owner)))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return held
+
+    # -- Meta -------------------------------------------------------------
+
+    async def get_meta(self, key: str):
+        return await self._call(self._get_meta, key)
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?",
+                                 (key,)).fetchone()
+        return row["value"] if row else None
+
+    async def set_meta(self, key: str, value: str):
+        await self._call(self._set_meta, key, value)
+
+    def _set_meta(self, key, value):
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value))
+
+    # -- Legacy JSON import -----------------------------------------------
+
+    async def import_json(self, path: str, source: str) -> int:
+        """Copy jobs from a legacy JSON job file into the store, once.
+
+        The import is recorded in the ``meta`` table so later starts skip it;
+        the JSON file itself is left untouched.
+        """
+        return await self._call(self._import_json, path, source)
+
+    def _import_json(self, path, source):
+        key = f"imported:{path}"
+        # Checked inside the write transaction: with several bot processes
+        # sharing the store, only the first to get here imports the file.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?",
+                                  (key,)).fetchone():
+                self._conn.execute("COMMIT")
+                return 0
+            try:
+                with open(path, "r") as file:
+                    content = file.read()
+                jobs = json.loads(content) if content.strip() else []
+            except (FileNotFoundError, json.JSONDecodeError):
+                jobs = []
+            for job in jobs:
+                job.setdefault("id", uuid.uuid4().hex)
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO purge_jobs"
+                    " (id, source, guild_id, channel_id, next_run_time, job_state)"
+                    " VALUES (?, ?, ?, ?, ?, ?)", self._row_values(job, source))
+            self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)",
+                               (key, str(len(jobs))))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return len(jobs)
@@ -0,0 +1,131 @@
+import contextlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# The job (or purge run) the current task is working for. asyncio copies
+# context variables into tasks it creates, so everything a job triggers
+# (its claim, purge, and reschedule) logs under the same id.
+correlation_id: ContextVar[str | None] = ContextVar("correlation_id", default=None)
+
+DEFAULT_LOG_FILE = "logs/purgebot.log"
+DEFAULT_MAX_BYTES = 10 * 2**20
+DEFAULT_BACKUPS = 5
+
+# Attributes every LogRecord has; anything else came in through ``extra``.
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+@contextlib.contextmanager
+def correlation(value):
+    """Log everything inside the block (and tasks it starts) under ``value``."""
+    token = correlation_id.set(value)
+    try:
+        yield
+    finally:
+        correlation_id.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, extras."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != "sample":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the current correlation id.
+
+    Runs in the logging call (on the event loop), before the record is
+    queued, since the writer thread can't see the task's context.
+    """
+
+    def filter(self, record):
+        if getattr(record, "correlation_id", None) is None:
+            record.correlation_id = correlation_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of hot-path records.
+
+    A record logged with ``extra={"sample": 0.01}`` is kept with that
+    probability; records without ``sample`` always pass.
+    """
+
+    def filter(self, record):
+        rate = getattr(record, "sample", None)
+        return rate is None or random.random() < rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The stock prepare() flattens the record to its message, which
+        # drops the extras the JSON formatter needs. Only freeze what can't
+        # safely cross threads.
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level=None, path=None, max_bytes=DEFAULT_MAX_BYTES,
+                  backups=DEFAULT_BACKUPS) -> logging.handlers.QueueListener:
+    """Route all logging through a queue to a background writer thread.
+
+    The event loop only enqueues records; a ``QueueListener`` thread
+    formats them and writes JSON lines to a size-rotated file and to
+    stderr. Configured by ``LOG_LEVEL`` and ``LOG_FILE`` unless given.
+    Returns the listener, which must be stopped at shutdown to flush.
+    """
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    path = path or os.getenv("LOG_FILE", DEFAULT_LOG_FILE)
+    formatter = JsonFormatter()
+    handlers = []
+    if path:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(formatter)
+    handlers.append(console)
+
+    records = queue.SimpleQueue()
+    queue_handler = _QueueHandler(records)
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    # discord.py's gateway debug output would swamp everything else.
+    logging.getLogger("discord").setLevel(max(root.level, logging.INFO))
+
+    listener = logging.handlers.QueueListener(records, *handlers,
+                                              respect_handler_level=True)
+    listener.start()
+    return listener
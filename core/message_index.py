@@ -0,0 +1,405 @@
+import asyncio
+import bisect
+import collections
+import logging
+import mmap
+import os
+import struct
+from array import array
+
+import discord
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PATH = "message_index.bin"
+# Ids held across all channels (8 bytes each) before cold channels are
+# evicted, and per channel before its oldest ids are dropped.
+DEFAULT_MAX_IDS = 2_000_000
+MAX_IDS_PER_CHANNEL = 50_000
+# Messages read to close the gap after a restart or a lost gateway session.
+# A channel that got more than this meanwhile is dropped from the index.
+CATCH_UP_LIMIT = 1_000
+SAVE_INTERVAL = 60.0
+
+# covered_from of a channel nothing has been read for yet.
+NOT_COVERED = 2**64 - 1
+
+_MAGIC = b"PBIDX1\0\0"
+_HEADER = struct.Struct("<8sQ")
+# channel_id, covered_from, pinned, id count
+_CHANNEL = struct.Struct("<QQQQ")
+
+
+class ChannelIndex:
+    """The ids of one channel's messages, ascending, in an ``array('Q')``.
+
+    ``covered_from`` is the coverage guarantee: every message in the
+    channel with an id at or above it is in ``ids``, unless it was
+    deleted. That holds while the bot keeps receiving the channel's
+    message and delete events. ``stale_after`` is set when it may have
+    missed some (loaded from disk, or after a new gateway session): the
+    newest id known before the gap, kept until the channel has caught up
+    from history.
+    """
+
+    __slots__ = ("ids", "covered_from", "pinned", "stale_after")
+
+    def __init__(self, covered_from: int, ids=(), pinned: bool = False):
+        self.ids = array("Q", sorted(ids))
+        self.covered_from = covered_from
+        self.pinned = pinned
+        self.stale_after = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def stale(self) -> bool:
+        return self.stale_after is not None
+
+    def mark_stale(self, rescan: bool = False):
+        """Flag a possible gap after the newest id.
+
+        With ``rescan``, the newest messages are read again instead.
+        """
+        if rescan:
+            self.stale_after = -1
+        elif self.stale_after is None:
+            newest = self.covered_from - 1
+            self.stale_after = max(self.ids[-1], newest) if self.ids else newest
+
+    def add(self, message_id: int):
+        ids = self.ids
+        if not ids or message_id > ids[-1]:
+            ids.append(message_id)
+        elif message_id >= self.covered_from:
+            index = bisect.bisect_left(ids, message_id)
+            if index == len(ids) or ids[index] != message_id:
+                ids.insert(index, message_id)
+
+    def discard(self, message_id: int):
+        index = bisect.bisect_left(self.ids, message_id)
+        if index < len(self.ids) and self.ids[index] == message_id:
+            del self.ids[index]
+
+    def merge(self, ids, covered_from: int):
+        """Add a continuous run of ids read from history, down to ``covered_from``."""
+        self.ids = array("Q", sorted(set(self.ids).union(ids)))
+        self.covered_from = min(self.covered_from, covered_from)
+
+    def reset(self, ids, covered_from: int):
+        """Replace coverage with a fresh run of ids.
+
+        Anything newer, tracked while the run was read, is kept.
+        """
+        self.ids = array("Q", sorted(set(ids).union(
+            message_id for message_id in self.ids if message_id >= covered_from)))
+        self.covered_from = covered_from
+
+    def trim(self, keep: int):
+        """Drop all but the newest ``keep`` ids, giving up coverage of the rest."""
+        if len(self.ids) > keep:
+            del self.ids[:len(self.ids) - keep]
+            self.covered_from = self.ids[0] if self.ids else self.covered_from
+
+    def select(self, limit: int | None, before: int | None = None,
+               after: int | None = None, oldest_first: bool = False) -> list | None:
+        """The ids a history scan with these arguments would return, or None.
+
+        None means the answer may include messages from before
+        ``covered_from``, which only history can tell.
+        """
+        if self.stale:
+            return None
+        low = bisect.bisect_right(self.ids, after) if after is not None else 0
+        high = (bisect.bisect_left(self.ids, before) if before is not None
+                else len(self.ids))
+        count = max(high - low, 0)
+        # The range reaches below what is covered unless it stops at
+        # ``after`` first, or ``limit`` ids are found before it gets there.
+        bounded = after is not None and after + 1 >= self.covered_from
+        if oldest_first:
+            if not bounded:
+                return None
+            stop = high if limit is None else min(high, low + limit)
+            return self.ids[low:stop].tolist()
+        if limit is not None and count >= limit:
+            return self.ids[high - limit:high].tolist()[::-1]
+        if not bounded and self.covered_from > 0:
+            return None
+        return self.ids[low:high].tolist()[::-1]
+
+    def expire(self, cutoff_id: int | None, max_count: int | None, limit: int) -> list:
+        """Take up to ``limit`` of the oldest ids.
+
+        Those are the ids older than ``cutoff_id`` or past ``max_count``.
+        """
+        count = 0
+        if cutoff_id is not None:
+            count = bisect.bisect_left(self.ids, cutoff_id)
+        if max_count is not None:
+            count = max(count, len(self.ids) - max_count)
+        count = min(count, limit)
+        expired = self.ids[:count].tolist()
+        del self.ids[:count]
+        return expired
+
+    def restore(self, ids):
+        """Put back ids taken by ``expire`` that weren't deleted after all."""
+        self.ids = array("Q", sorted(set(self.ids).union(ids)))
+
+
+class MessageIndex:
+    """Recent message ids of the channels the bot sees messages in.
+
+    Fed by gateway message and delete events, so purges and retention can
+    find a channel's newest messages without reading its history. Only
+    ids are kept, at 8 bytes each. When more than ``max_ids`` are held,
+    the least recently used channels are evicted, except pinned ones
+    (retention channels). The index is saved to ``path`` every
+    ``SAVE_INTERVAL`` seconds and loaded from it (memory-mapped) on start.
+    Loaded channels are stale until ``catch_up`` has read what they
+    missed while the bot was down.
+
+    Deletions made while the bot was offline are not seen. A purge using
+    the index may then find some of its ids already gone, and deletes
+    fewer messages than asked, never more.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, max_ids: int = DEFAULT_MAX_IDS):
+        self.path = path
+        self.max_ids = max_ids
+        self.channels = collections.OrderedDict()
+        self._size = 0
+        self._dirty = False
+        self._task = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self._size * 8
+
+    def get(self, channel_id: int) -> ChannelIndex | None:
+        entry = self.channels.get(channel_id)
+        if entry is not None:
+            self.channels.move_to_end(channel_id)
+        return entry
+
+    def pin(self, channel_id: int) -> ChannelIndex:
+        """The channel's index, created if needed and exempt from eviction."""
+        entry = self.get(channel_id)
+        if entry is None:
+            # Nothing is covered until the channel's history has been read.
+            entry = self.channels[channel_id] = ChannelIndex(NOT_COVERED)
+        if not entry.pinned and entry.covered_from > 0:
+            # Coverage so far starts wherever this session happened to; read
+            # the newest messages so retention sees the older ones too.
+            entry.mark_stale(rescan=True)
+        entry.pinned = True
+        return entry
+
+    def unpin(self, channel_id: int):
+        entry = self.channels.get(channel_id)
+        if entry is not None:
+            entry.pinned = False
+
+    def drop(self, channel_id: int):
+        entry = self.channels.pop(channel_id, None)
+        if entry is not None:
+            self._size -= len(entry)
+            self._dirty = True
+
+    def invalidate(self):
+        """Mark every channel stale, e.g. after a new gateway session."""
+        for entry in self.channels.values():
+            entry.mark_stale()
+
+    # -- Gateway events ---------------------------------------------------
+
+    def track(self, message: discord.Message):
+        if message.guild is None:
+            return
+        entry = self.get(message.channel.id)
+        if entry is None:
+            # Coverage starts with the first message seen.
+            entry = self.channels[message.channel.id] = ChannelIndex(message.id)
+        before = len(entry)
+        entry.add(message.id)
+        if len(entry) > MAX_IDS_PER_CHANNEL and not entry.pinned:
+            entry.trim(MAX_IDS_PER_CHANNEL)
+        self._resized(before, entry)
+        self._evict()
+
+    def forget(self, channel_id: int, message_ids):
+        entry = self.channels.get(channel_id)
+        if entry is not None:
+            before = len(entry)
+            for message_id in message_ids:
+                entry.discard(message_id)
+            self._resized(before, entry)
+
+    def expire(self, channel_id: int, cutoff_id: int | None, max_count: int | None,
+               limit: int) -> list:
+        entry = self.channels.get(channel_id)
+        if entry is None:
+            return []
+        before = len(entry)
+        expired = entry.expire(cutoff_id, max_count, limit)
+        self._resized(before, entry)
+        return expired
+
+    def restore(self, channel_id: int, ids):
+        entry = self.channels.get(channel_id)
+        if entry is not None:
+            before = len(entry)
+            entry.restore(ids)
+            self._resized(before, entry)
+
+    def _resized(self, before, entry):
+        self._size += len(entry) - before
+        self._dirty = True
+
+    def _evict(self):
+        if self._size <= self.max_ids:
+            return
+        for channel_id in list(self.channels):
+            if self._size <= self.max_ids:
+                break
+            if not self.channels[channel_id].pinned:
+                self.drop(channel_id)
+
+    # -- Lookups ----------------------------------------------------------
+
+    async def lookup(self, channel: discord.TextChannel, limit: int | None,
+                     before: int | None = None, after: int | None = None,
+                     oldest_first: bool = False) -> list | None:
+        """Ids a history scan of ``channel`` would return, or None on a miss."""
+        entry = self.get(channel.id)
+        if entry is None:
+            return None
+        if entry.stale and not await self.catch_up(channel):
+            return None
+        return entry.select(limit, before, after, oldest_first)
+
+    async def catch_up(self, channel: discord.TextChannel,
+                       limit: int = CATCH_UP_LIMIT) -> bool:
+        """Read what a stale channel missed from history; False if it can't be covered.
+
+        A channel more than ``limit`` messages behind is dropped, unless
+        it is pinned. Pinned channels, and ones marked for a rescan, start
+        over from their newest ``limit`` messages instead.
+        """
+        entry = self.channels.get(channel.id)
+        if entry is None:
+            return False
+        if not entry.stale:
+            return True
+        ids = None
+        if entry.covered_from <= entry.stale_after:
+            ids = [message.id async for message in channel.history(
+                limit=limit, after=discord.Object(id=entry.stale_after),
+                oldest_first=True)]
+            if len(ids) >= limit:
+                if not entry.pinned:
+                    self.drop(channel.id)
+                    return False
+                ids = None  # Too far behind to close the gap.
+        covered_from = None
+        if ids is None:
+            ids = [message.id async for message in channel.history(limit=limit)]
+            covered_from = 0 if len(ids) < limit else ids[-1]
+        if self.channels.get(channel.id) is not entry:
+            return False  # Dropped while reading.
+        before = len(entry)
+        if covered_from is None:
+            entry.merge(ids, entry.covered_from)
+        else:
+            entry.reset(ids, covered_from)
+        entry.stale_after = None
+        self._resized(before, entry)
+        return True
+
+    # -- Persistence ------------------------------------------------------
+
+    def _snapshot(self) -> list:
+        return [(channel_id, entry.covered_from, entry.pinned, entry.ids.tobytes())
+                for channel_id, entry in self.channels.items()]
+
+    def _write(self, snapshot):
+        size = _HEADER.size + sum(_CHANNEL.size + len(ids) for *_, ids in snapshot)
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb+") as file:
+            file.truncate(size)
+            with mmap.mmap(file.fileno(), size) as view:
+                _HEADER.pack_into(view, 0, _MAGIC, len(snapshot))
+                offset = _HEADER.size
+                for channel_id, covered_from, pinned, ids in snapshot:
+                    _CHANNEL.pack_into(view, offset, channel_id, covered_from, pinned,
+                                       len(ids) // 8)
+                    offset += _CHANNEL.size
+                    view[offset:offset + len(ids)] = ids
+                    offset += len(ids)
+                view.flush()
+        os.replace(temporary, self.path)
+
+    def _read(self):
+        channels = collections.OrderedDict()
+        try:
+            with (open(self.path, "rb") as file,
+                  mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view):
+                magic, count = _HEADER.unpack_from(view, 0)
+                if magic != _MAGIC:
+                    raise ValueError("not a message index file")
+                offset = _HEADER.size
+                for _ in range(count):
+                    channel_id, covered_from, pinned, length = _CHANNEL.unpack_from(
+                        view, offset)
+                    offset += _CHANNEL.size
+                    entry = ChannelIndex(covered_from, pinned=bool(pinned))
+                    entry.ids.frombytes(view[offset:offset + length * 8])
+                    entry.mark_stale()
+                    offset += length * 8
+                    channels[channel_id] = entry
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, struct.error):
+            log.exception("Ignoring unreadable message index",
+                          extra={"path": self.path})
+            channels.clear()
+        return channels
+
+    async def load(self):
+        channels = await asyncio.to_thread(self._read)
+        # Entries pinned by retention before the load keep their flag.
+        for channel_id, entry in channels.items():
+            if channel_id not in self.channels:
+                self.channels[channel_id] = entry
+                self._size += len(entry)
+        self._evict()
+
+    async def save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        # Copy on the loop (a memcpy per channel); write off it.
+        await asyncio.to_thread(self._write, self._snapshot())
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._save_loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(SAVE_INTERVAL)
+            try:
+                await self.save()
+            except OSError:
+                log.exception("Error saving the message index",
+                              extra={"path": self.path})
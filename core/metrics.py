@@ -0,0 +1,222 @@
+import bisect
+import re
+import threading
+
+import aiohttp
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0, 300.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, registry=None):
+        self.name = name
+        self.documentation = documentation
+        # Observations come from the event loop and the job store's thread.
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self.samples()
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A value that only goes up, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, or is read when scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def set_function(self, function):
+        """Report ``function()`` at each scrape instead of a stored value."""
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            yield f"{self.name} {_format_value(self._function())}"
+            return
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Counts of observations in cumulative buckets, plus their sum."""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, (counts[:], total, count))
+                            for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                cumulative += bucket_count
+                labels = _format_labels(key, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(key)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+SCHEDULER_LAG = Histogram(
+    "purge_scheduler_lag_seconds",
+    "Time between a job's scheduled time and when it actually fired.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 15.0, 60.0, 300.0, 3600.0))
+SCHEDULED_JOBS = Gauge(
+    "purge_scheduled_jobs", "Jobs loaded into this process's timer.")
+PURGE_DURATION = Histogram(
+    "purge_run_duration_seconds", "Wall time of a purge run.")
+MESSAGES_DELETED = Counter(
+    "purge_messages_deleted_total",
+    "Messages deleted, by mode: bulk (newer than 14 days) or single.")
+RATE_LIMITED = Counter(
+    "discord_rate_limited_total", "HTTP 429 responses from Discord, by route.")
+STORE_LATENCY = Histogram(
+    "jobstore_operation_seconds",
+    "Job store call latency, including queueing, by operation.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+QUEUE_DEPTH = Gauge(
+    "purge_executor_queue_depth", "Purges queued on the executor and not yet running.")
+COMMAND_LATENCY = Histogram(
+    "app_command_seconds", "Slash command handling time, by command and outcome.")
+SLOW_CALLBACKS = Counter(
+    "event_loop_stalls_total",
+    "Times a single callback blocked the event loop past the threshold.")
+
+# Snowflakes in request paths; replaced so routes aggregate.
+_SNOWFLAKE = re.compile(r"/\d{15,}")
+_API_PREFIX = re.compile(r"^/api/v\d+")
+
+
+def route_name(method: str, path: str) -> str:
+    return f"{method} {_SNOWFLAKE.sub('/:id', _API_PREFIX.sub('', path))}"
+
+
+def http_trace() -> aiohttp.TraceConfig:
+    """Counts Discord's 429s per route; pass as the client's ``http_trace``.
+
+    discord.py retries rate-limited requests internally, so the only place
+    they are visible is the HTTP session itself.
+    """
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_end(_session, _context, params):
+        if params.response.status == 429:
+            RATE_LIMITED.inc(route=route_name(params.method, params.url.path))
+
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Serve the registry in the Prometheus text format at ``/metrics``."""
+
+    async def metrics(_request):
+        return web.Response(
+            body=REGISTRY.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
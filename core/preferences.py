@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+PREFERENCES_FILE = "userpreferences.json"
+# Legacy single-preference file, folded into the store on first load.
+LEGACY_TIMEZONES_FILE = "usertimezones.json"
+FLUSH_DELAY = 2.0
+
+
+class PreferenceStore:
+    """Per-user preferences held in memory with write-behind persistence.
+
+    Reads and writes are plain dictionary operations on the event loop, so
+    concurrent callbacks can't lose each other's updates. Changes mark the
+    store dirty and a single flush, ``FLUSH_DELAY`` seconds later, writes
+    every change made in the meantime. The file is written in a worker
+    thread to a temporary file and moved into place, so a crash leaves
+    either the old or the new file, never a partial one.
+    """
+
+    def __init__(self, path: str = PREFERENCES_FILE,
+                 legacy_timezones_path: str = LEGACY_TIMEZONES_FILE,
+                 flush_delay: float = FLUSH_DELAY):
+        self.path = path
+        self.legacy_timezones_path = legacy_timezones_path
+        self.flush_delay = flush_delay
+        self._users = {}
+        self._dirty = False
+        self._flush_task = None
+        self._write_lock = asyncio.Lock()
+
+    async def load(self):
+        self._users = await asyncio.to_thread(self._read)
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError:
+            # Starting without preferences beats not starting at all; the
+            # next change overwrites the file.
+            log.exception("Unreadable preferences file; starting with none",
+                          extra={"path": self.path})
+            return {}
+        users = {}
+        try:
+            with open(self.legacy_timezones_path, "r") as file:
+                for user_id, zone_name in json.load(file).items():
+                    users[user_id] = {"timezone": zone_name}
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return users
+
+    def get(self, user_id, key: str, default=None):
+        return self._users.get(str(user_id), {}).get(key, default)
+
+    def set(self, user_id, key: str, value):
+        self._users.setdefault(str(user_id), {})[key] = value
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    async def flush(self):
+        async with self._write_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            snapshot = {user_id: dict(prefs) for user_id, prefs in self._users.items()}
+            try:
+                await asyncio.to_thread(self._write, snapshot)
+            except OSError:
+                self._dirty = True
+                log.exception("Error saving user preferences")
+
+    def _write(self, users):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(users, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
@@ -0,0 +1,208 @@
+import logging
+import time
+
+import discord
+
+from core.filters import MessageFilter
+from core.purge import BULK_DELETE_CHUNK, bulk_cutoff, scan_range
+from core.quotas import DAILY_PURGE_VOLUME
+from core.ratelimit import ROUTE_RATES
+
+log = logging.getLogger(__name__)
+
+# How long a preview's history pages stay around for the purge that
+# confirms it, and how many messages of one preview are kept.
+PREVIEW_CACHE_TTL = 120.0
+PREVIEW_CACHE_LIMIT = 10_000
+
+
+class HistoryCache:
+    """History read by a purge preview, kept briefly for the purge after it.
+
+    One scan per channel, keyed by the scan's arguments, so only a purge
+    that reads exactly the same range reuses it. An entry is handed out
+    once and then dropped. A preview longer than ``PREVIEW_CACHE_LIMIT``
+    keeps its first messages, and the purge reads the rest from history.
+    """
+
+    def __init__(self, ttl: float = PREVIEW_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, channel_id: int, messages: list, complete: bool, *, limit,
+            before=None, after=None, oldest_first: bool = False):
+        """Keep a scan's messages; ``complete`` if the scan read no further."""
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry[1] <= now]:
+            del self._entries[key]
+        self._entries[channel_id] = (_scan_key(limit, before, after, oldest_first),
+                                     now + self.ttl, messages, complete)
+
+    def take(self, channel_id: int, *, limit, before=None, after=None,
+             oldest_first: bool = False):
+        """``(messages, complete)`` of a matching, fresh scan, or None."""
+        entry = self._entries.get(channel_id)
+        if entry is None or entry[0] != _scan_key(limit, before, after, oldest_first):
+            return None
+        del self._entries[channel_id]
+        if entry[1] <= time.monotonic():
+            return None
+        return entry[2], entry[3]
+
+    async def history(self, channel: discord.TextChannel, *, limit, before=None,
+                      after=None, oldest_first: bool = False):
+        """``channel.history``, starting from a cached scan if one matches."""
+        cached = self.take(channel.id, limit=limit, before=before, after=after,
+                           oldest_first=oldest_first)
+        if cached is not None:
+            messages, complete = cached
+            log.debug("Reusing previewed history", extra={
+                "channel_id": channel.id, "count": len(messages)})
+            for message in messages:
+                yield message
+            if complete or not messages:
+                return
+            if limit is not None:
+                limit -= len(messages)
+                if limit <= 0:
+                    return
+            # Carry on from the last cached message in scan order.
+            if oldest_first:
+                after = messages[-1]
+            else:
+                before = messages[-1]
+        async for message in channel.history(limit=limit, before=before, after=after,
+                                             oldest_first=oldest_first):
+            yield message
+
+
+class PurgePreview:
+    """What a purge would delete if it ran now."""
+
+    __slots__ = ("scanned", "bulk", "single", "remaining", "capped", "indexed")
+
+    def __init__(self):
+        self.scanned = 0
+        self.bulk = 0
+        self.single = 0
+        self.remaining = DAILY_PURGE_VOLUME
+        self.capped = False
+        self.indexed = False
+
+    @property
+    def total(self) -> int:
+        return self.bulk + self.single
+
+    @property
+    def estimate(self) -> float:
+        """Seconds the deletions take at the rate limiter's pace.
+
+        History reads aren't counted: the purge confirming this preview
+        reuses them.
+        """
+        requests, leftover = divmod(self.bulk, BULK_DELETE_CHUNK)
+        singles = self.single
+        if leftover == 1:
+            singles += 1  # The bulk endpoint requires at least two messages.
+        elif leftover:
+            requests += 1
+        return _paced(requests, "bulk_delete") + _paced(singles, "delete")
+
+
+async def preview_purge(store, channel: discord.TextChannel, limit: int | None, *,
+                        before=None, after=None, oldest_first: bool = False,
+                        filters: dict | None = None, index=None,
+                        cache: HistoryCache | None = None) -> PurgePreview:
+    """Count what ``run_purge`` with the same arguments would delete.
+
+    The scan is the purge's own: the same daily volume cap, time bounds,
+    filters, scan limit and message index. Nothing is deleted. With a
+    ``cache``, the messages read are kept so that the purge confirming
+    the preview doesn't fetch them again.
+    """
+    preview = PurgePreview()
+    used = await store.guild_usage(channel.guild.id)
+    preview.remaining = max(DAILY_PURGE_VOLUME - used, 0)
+    if preview.remaining == 0:
+        preview.capped = True
+        return preview
+    clamped = limit is None or limit > preview.remaining
+    limit = preview.remaining if clamped else limit
+    message_filter = MessageFilter(filters) if filters else None
+    before, after, scan_limit, message_filter = scan_range(
+        limit, before, after, message_filter)
+    cutoff = bulk_cutoff()
+
+    ids = None
+    if message_filter is None and index is not None:
+        ids = await index.lookup(channel, limit, before=_id(before), after=_id(after),
+                                 oldest_first=oldest_first)
+    if ids is not None:
+        preview.indexed = True
+        preview.scanned = len(ids)
+        preview.bulk = sum(1 for message_id in ids if message_id > cutoff)
+        preview.single = len(ids) - preview.bulk
+    else:
+        messages = []
+        complete = True
+        async for message in channel.history(limit=scan_limit, before=before,
+                                             after=after, oldest_first=oldest_first):
+            preview.scanned += 1
+            if len(messages) < PREVIEW_CACHE_LIMIT:
+                messages.append(message)
+            else:
+                complete = False
+            if message_filter is None or await message_filter.matches(message):
+                if message.id > cutoff:
+                    preview.bulk += 1
+                else:
+                    preview.single += 1
+            if message_filter is not None and preview.total >= limit:
+                complete = False  # History goes on past the last message read.
+                break
+        if cache is not None:
+            cache.put(channel.id, messages, complete, limit=scan_limit, before=before,
+                      after=after, oldest_first=oldest_first)
+    preview.capped = clamped and preview.total >= limit
+    return preview
+
+
+def describe_preview(preview: PurgePreview) -> str:
+    lines = [
+        f"Would delete **{preview.total}** messages: {preview.bulk} in bulk and "
+        f"{preview.single} older than 14 days, one at a time.",
+        "Looked up in the message index." if preview.indexed
+        else f"Scanned {preview.scanned} messages.",
+        f"Estimated time: about {_duration(preview.estimate)}.",
+    ]
+    if preview.capped:
+        lines.append(f"Capped by the server's remaining daily purge volume "
+                     f"({preview.remaining} messages).")
+    return "\n".join(lines)
+
+
+def _paced(requests: int, route: str) -> float:
+    rate, capacity = ROUTE_RATES[route]
+    return max(requests - capacity, 0) / rate
+
+
+def _duration(seconds: float) -> str:
+    if seconds < 60:
+        seconds = max(round(seconds), 1)
+        return f"{seconds} second{'s' if seconds != 1 else ''}"
+    minutes, seconds = divmod(round(seconds), 60)
+    if minutes < 60:
+        return f"{minutes} min {seconds} s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} h {minutes} min"
+
+
+def _scan_key(limit, before, after, oldest_first):
+    return limit, _id(before), _id(after), oldest_first
+
+
+def _id(value):
+    return value.id if value is not None else None
@@ -0,0 +1,67 @@
+import os
+import resource
+import sys
+
+import discord
+
+DEFAULT_PROFILE = "lean"
+
+
+def bot_options(profile: str) -> dict:
+    """Gateway intents and cache settings for a runtime profile.
+
+    ``full`` is the original setup: every intent and discord.py's default
+    caches (every member, presence and the last 1000 messages). ``lean``
+    keeps only what the cogs use. Guilds, channels and roles still come
+    from the guilds intent, purges read ``channel.history`` from the API,
+    and slash commands carry the invoking member with the interaction. So
+    the bot needs no member list, presences or message cache. Guild
+    message events are kept for the message index (core/message_index.py),
+    which tracks message ids as they arrive; the messages themselves
+    aren't cached. Without the message content intent, the regex and
+    attachments purge filters are refused (see ``core.filters``).
+    """
+    if profile == "full":
+        return {"intents": discord.Intents.all()}
+    if profile == "lean":
+        return {
+            "intents": discord.Intents(guilds=True, guild_messages=True),
+            "max_messages": None,
+            "chunk_guilds_at_startup": False,
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+        }
+    raise ValueError(f"Unknown BOT_PROFILE {profile!r}; use 'lean' or 'full'")
+
+
+def active_profile(environ=os.environ) -> str:
+    return environ.get("BOT_PROFILE") or DEFAULT_PROFILE
+
+
+def resident_memory() -> int:
+    """Current resident set size in bytes (peak RSS where unavailable)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS, kilobytes elsewhere.
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def memory_report(client) -> dict:
+    guilds = len(client.guilds)
+    rss = resident_memory()
+    index = getattr(client, "message_index", None)
+    return {
+        "profile": getattr(client, "profile", DEFAULT_PROFILE),
+        "rss_bytes": rss,
+        "guilds": guilds,
+        "rss_per_1k_guilds": rss * 1000 // guilds if guilds else None,
+        "channels": sum(len(guild.channels) for guild in client.guilds),
+        "cached_members": sum(len(guild.members) for guild in client.guilds),
+        "cached_users": len(client.users),
+        "cached_messages": len(client.cached_messages),
+        "indexed_channels": len(index.channels) if index is not None else 0,
+        "indexed_messages": len(index) if index is not None else 0,
+        "index_bytes": index.nbytes if index is not None else 0,
+    }
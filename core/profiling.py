@@ -0,0 +1,170 @@
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import discord
+from discord import app_commands
+
+from core.metrics import COMMAND_LATENCY, SLOW_CALLBACKS
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SLOW_CALLBACK = 0.25
+DEFAULT_SAMPLE_INTERVAL = 0.005
+PROFILE_DIR = "profiles"
+
+
+def profiling_enabled(environ=os.environ) -> bool:
+    return environ.get("PROFILING", "").lower() in ("1", "true", "yes")
+
+
+def slow_callback_threshold(environ=os.environ) -> float:
+    return int(environ.get("SLOW_CALLBACK_MS", DEFAULT_SLOW_CALLBACK * 1000)) / 1000
+
+
+class LoopWatchdog:
+    """Reports callbacks that keep the event loop busy past ``threshold``.
+
+    The loop bumps a heartbeat a few times per threshold; a daemon thread
+    checks it, and when the heartbeat is late, captures the loop thread's
+    stack. That stack is whatever was running when the loop stalled,
+    which asyncio's own debug mode (slow_callback_duration) can't show.
+    Each stall is logged once, with the stack, and kept in ``stalls``.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SLOW_CALLBACK, history: int = 20):
+        self.threshold = threshold
+        self.stalls = collections.deque(maxlen=history)
+        self._beat = time.monotonic()
+        self._loop = None
+        self._loop_thread = None
+        self._handle = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start watching the running loop; call from the loop's thread."""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._tick()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._thread = None
+
+    def _tick(self):
+        self._beat = time.monotonic()
+        self._handle = self._loop.call_later(self.threshold / 4, self._tick)
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 4):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold or beat == reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            # Report each stall once; it may go on for a while yet.
+            reported = beat
+            stack = "".join(traceback.format_stack(frame))
+            self.stalls.append({"at": time.time(), "blocked_seconds": blocked,
+                                "stack": stack})
+            SLOW_CALLBACKS.inc()
+            log.warning("Event loop blocked", extra={
+                "blocked_seconds": round(blocked, 3), "stack": stack})
+
+
+class TimedCommandTree(app_commands.CommandTree):
+    """A command tree that records each slash command's handling time.
+
+    Timing starts at the tree's ``interaction_check``, before any command
+    checks, and stops when the command completes or fails. Pass as the
+    bot's ``tree_cls``; finished commands are reported by
+    ``observe_command`` from ``on_app_command_completion``.
+    """
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction,
+                       error: app_commands.AppCommandError):
+        observe_command(interaction, "error")
+        await super().on_error(interaction, error)
+
+
+def observe_command(interaction: discord.Interaction, outcome: str = "ok"):
+    started = interaction.extras.pop("started", None)
+    if started is None or interaction.command is None:
+        return
+    COMMAND_LATENCY.observe(time.perf_counter() - started,
+                            command=interaction.command.qualified_name, outcome=outcome)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    location = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}"
+    return f"{code.co_name} ({location})"
+
+
+def sample_stacks(thread_id: int, seconds: float,
+                  interval: float = DEFAULT_SAMPLE_INTERVAL) -> collections.Counter:
+    """Sample ``thread_id``'s stack every ``interval`` for ``seconds``.
+
+    Runs in the calling thread, so call it off the thread being sampled
+    (``asyncio.to_thread`` for the event loop). Returns a count per stack,
+    each stack a root-first tuple of ``function (file:line)`` frames. The
+    loop thread is only paused for the instant it takes to read its
+    frames, unlike cProfile, which slows every call it traces.
+    """
+    counts = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        if stack:
+            counts[tuple(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def hottest_frames(counts: collections.Counter, limit: int = 10) -> list:
+    """``(frame, samples)`` for the frames most often on top of the stack."""
+    leaves = collections.Counter()
+    for stack, count in counts.items():
+        leaves[stack[-1]] += count
+    return leaves.most_common(limit)
+
+
+def write_profile(counts: collections.Counter, directory: str = PROFILE_DIR) -> str:
+    """Write ``counts`` as folded stacks (one ``a;b;c N`` line per stack).
+
+    That is the input format of flamegraph.pl, speedscope and most other
+    flame graph viewers. Returns the file's path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"loop-{datetime.now():%Y%m%d-%H%M%S}.folded")
+    with open(path, "w", encoding="utf-8") as file:
+        for stack, count in counts.most_common():
+            file.write(f"{';'.join(stack)} {count}\n")
+    return path
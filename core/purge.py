@@ -0,0 +1,422 @@
+import asyncio
+import functools
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+import discord
+
+from core.filters import FILTERED_SCAN_LIMIT, MessageFilter
+from core.jobstore import LeaseLost
+from core.logs import correlation, correlation_id
+from core.metrics import MESSAGES_DELETED, PURGE_DURATION
+from core.quotas import DAILY_PURGE_VOLUME
+from core.ratelimit import RateLimiter
+
+# Discord rejects bulk deletes of messages older than 14 days. Leave a
+# margin so a message can't age past the limit while its batch is queued.
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+BULK_DELETE_CHUNK = 100
+SINGLE_DELETE_CONCURRENCY = 5
+PROGRESS_INTERVAL = 3.0
+# Messages between checkpoints of a resumable run.
+CHECKPOINT_EVERY = 100
+
+log = logging.getLogger(__name__)
+
+
+class PurgeStats:
+    __slots__ = ("scanned", "bulk_deleted", "single_deleted", "started")
+
+    def __init__(self):
+        self.scanned = 0
+        self.bulk_deleted = 0
+        self.single_deleted = 0
+        self.started = time.monotonic()
+
+    @property
+    def deleted(self) -> int:
+        return self.bulk_deleted + self.single_deleted
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
+async def purge_messages(channel: discord.TextChannel, limit: int | None, *,
+                         limiter: RateLimiter, before=None, after=None,
+                         oldest_first: bool = False, progress=None,
+                         checkpoint=None, message_filter: MessageFilter | None = None,
+                         index=None, cache=None) -> PurgeStats:
+    """Delete up to ``limit`` messages from ``channel``.
+
+    History is streamed page by page (discord.py fetches 100 at a time) and
+    each message is routed as it arrives: messages young enough for bulk
+    delete are sent in chunks of 100, older ones are deleted individually,
+    several at once within the limiter's budget. ``before``/``after`` bound
+    the scan so nothing outside the range is fetched, and the scan stops as
+    soon as ``limit`` messages have been seen.
+
+    ``progress`` is an optional coroutine function called with the running
+    stats at most every few seconds. ``checkpoint`` is called with the id of
+    the last scanned message and the stats every ``CHECKPOINT_EVERY``
+    messages, once every message up to that one has been dealt with.
+
+    With a ``message_filter``, its time window narrows ``before``/``after``
+    and only messages it matches are deleted. ``limit`` then counts
+    deletions rather than messages scanned, and the scan reads at most
+    ``FILTERED_SCAN_LIMIT`` messages (or ``limit``, if larger).
+
+    Unless a filter needs to see the messages, an ``index``
+    (``core.message_index.MessageIndex``) is asked first. When it covers
+    the range, its ids are deleted directly and history is never read.
+    Otherwise a ``cache`` (``core.preview.HistoryCache``) may hand back the
+    messages a preview of the same scan just read.
+    """
+    stats = PurgeStats()
+    before, after, scan_limit, message_filter = scan_range(
+        limit, before, after, message_filter)
+    if message_filter is None and index is not None:
+        ids = await index.lookup(channel, limit, before=_snowflake(before),
+                                 after=_snowflake(after), oldest_first=oldest_first)
+        if ids is not None:
+            return await _purge_indexed(channel, ids, limiter=limiter, index=index,
+                                        progress=progress, checkpoint=checkpoint)
+    matched = 0
+    cutoff = bulk_cutoff()
+    batch = []
+    singles = set()
+    failures = []
+    slots = asyncio.Semaphore(SINGLE_DELETE_CONCURRENCY)
+    last_report = time.monotonic()
+    last_checkpoint = 0
+
+    async def flush():
+        if not batch:
+            return
+        messages = batch[:]
+        batch.clear()
+        await limiter.acquire("bulk_delete", channel.id)
+        if len(messages) == 1:
+            # The bulk endpoint requires at least two messages.
+            await _delete_one(messages[0])
+        else:
+            await channel.delete_messages(messages)
+        stats.bulk_deleted += len(messages)
+        MESSAGES_DELETED.inc(len(messages), mode="bulk")
+        log.debug("Bulk deleted messages", extra={
+            "channel_id": channel.id, "count": len(messages), "sample": 0.1})
+
+    async def delete_single(message):
+        try:
+            await limiter.acquire("delete", channel.id)
+            if await _delete_one(message):
+                stats.single_deleted += 1
+                MESSAGES_DELETED.inc(mode="single")
+                log.debug("Deleted message", extra={
+                    "channel_id": channel.id, "message_id": message.id, "sample": 0.01})
+        finally:
+            slots.release()
+
+    def settle(task):
+        singles.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            failures.append(task.exception())
+
+    async def drain():
+        # Fails the purge like a failed bulk delete would.
+        if singles:
+            await asyncio.gather(*singles, return_exceptions=True)
+        if failures:
+            raise failures[0]
+
+    # A preview of this very scan may have just read its pages.
+    history = (channel.history if cache is None
+               else functools.partial(cache.history, channel))
+    async for message in history(limit=scan_limit, before=before,
+                                 after=after, oldest_first=oldest_first):
+        stats.scanned += 1
+        if message_filter is None or await message_filter.matches(message):
+            matched += 1
+            if message.id > cutoff:
+                batch.append(message)
+                if len(batch) >= BULK_DELETE_CHUNK:
+                    await flush()
+            else:
+                # Waiting for a slot applies back-pressure to the history scan.
+                await slots.acquire()
+                if failures:
+                    slots.release()
+                    await drain()
+                task = asyncio.create_task(delete_single(message))
+                singles.add(task)
+                task.add_done_callback(settle)
+
+        if (checkpoint is not None
+                and stats.scanned - last_checkpoint >= CHECKPOINT_EVERY):
+            # Everything scanned so far must be deleted before the cursor
+            # moves past it, otherwise a resume would skip those messages.
+            await flush()
+            await drain()
+            last_checkpoint = stats.scanned
+            await checkpoint(message.id, stats)
+
+        if progress is not None and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            await progress(stats)
+
+        if message_filter is not None and limit is not None and matched >= limit:
+            break
+
+    await flush()
+    await drain()
+    return stats
+
+
+def scan_range(limit: int | None, before, after, message_filter: MessageFilter | None):
+    """The history scan of a purge: ``(before, after, scan_limit, message_filter)``.
+
+    A filter's time window narrows ``before``/``after``. The filter is
+    returned only if it is selective, and then the scan reads at least
+    ``FILTERED_SCAN_LIMIT`` messages. The bounds may be datetimes,
+    snowflakes or objects, and come back as ``discord.Object``.
+    """
+    before = _snowflake_object(_snowflake(before))
+    after = _snowflake_object(_snowflake(after))
+    scan_limit = limit
+    if message_filter is not None:
+        before, after = message_filter.bounds(_snowflake(before), _snowflake(after))
+        before, after = _snowflake_object(before), _snowflake_object(after)
+        if message_filter.selective:
+            scan_limit = max(limit or 0, FILTERED_SCAN_LIMIT)
+        else:
+            message_filter = None
+    return before, after, scan_limit, message_filter
+
+
+def bulk_cutoff() -> int:
+    """The snowflake above which messages can still be bulk deleted.
+
+    Message ids are timestamps, so routing a message is an integer
+    comparison on its id rather than building its created_at.
+    """
+    return discord.utils.time_snowflake(discord.utils.utcnow() - BULK_DELETE_MAX_AGE)
+
+
+async def delete_message_ids(channel: discord.TextChannel, ids, *,
+                             limiter: RateLimiter) -> PurgeStats:
+    """Delete the messages with ``ids`` from ``channel`` without a history scan.
+
+    For callers that already know which messages to delete (retention
+    policies). Ids young enough for bulk delete go out in chunks of 100,
+    older ones one at a time. Ids of messages that are already gone are
+    skipped by Discord, so they are harmless.
+    """
+    stats = PurgeStats()
+    cutoff = bulk_cutoff()
+    recent = [message_id for message_id in ids if message_id > cutoff]
+    old = [message_id for message_id in ids if message_id <= cutoff]
+    stats.scanned = len(recent) + len(old)
+    for start in range(0, len(recent), BULK_DELETE_CHUNK):
+        chunk = recent[start:start + BULK_DELETE_CHUNK]
+        if len(chunk) == 1:
+            old.extend(chunk)  # The bulk endpoint requires at least two messages.
+            continue
+        await limiter.acquire("bulk_delete", channel.id)
+        await channel.delete_messages(
+            [discord.Object(id=message_id) for message_id in chunk])
+        stats.bulk_deleted += len(chunk)
+        MESSAGES_DELETED.inc(len(chunk), mode="bulk")
+    slots = asyncio.Semaphore(SINGLE_DELETE_CONCURRENCY)
+
+    async def delete_single(message_id):
+        async with slots:
+            await limiter.acquire("delete", channel.id)
+            if await _delete_one(channel.get_partial_message(message_id)):
+                stats.single_deleted += 1
+                MESSAGES_DELETED.inc(mode="single")
+
+    await asyncio.gather(*(delete_single(message_id) for message_id in old))
+    return stats
+
+
+async def _purge_indexed(channel, ids, *, limiter, index, progress,
+                         checkpoint) -> PurgeStats:
+    """Delete ids found in the message index, in scan order, checkpointing as we go."""
+    stats = PurgeStats()
+    last_report = time.monotonic()
+    for start in range(0, len(ids), CHECKPOINT_EVERY):
+        chunk = ids[start:start + CHECKPOINT_EVERY]
+        done = await delete_message_ids(channel, chunk, limiter=limiter)
+        index.forget(channel.id, chunk)
+        stats.scanned += done.scanned
+        stats.bulk_deleted += done.bulk_deleted
+        stats.single_deleted += done.single_deleted
+        if checkpoint is not None:
+            await checkpoint(chunk[-1], stats)
+        if progress is not None and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            await progress(stats)
+    log.debug("Purged from the message index", extra={
+        "channel_id": channel.id, "count": len(ids)})
+    return stats
+
+
+async def _delete_one(message) -> bool:
+    try:
+        await message.delete()
+    except discord.NotFound:
+        return False  # Already gone; nothing to do.
+    return True
+
+
+async def run_purge(store, channel: discord.TextChannel, limit: int | None, *,
+                    limiter: RateLimiter, before=None, after=None,
+                    oldest_first: bool = False, progress=None,
+                    filters: dict | None = None, index=None, cache=None,
+                    run_id: str | None = None, resumed=None) -> PurgeStats:
+    """Run ``purge_messages`` as a resumable run checkpointed in ``store``.
+
+    ``before``/``after`` may be datetimes or snowflakes; they are stored as
+    snowflake ids so ``resume_runs`` can rebuild the scan after a restart.
+    ``filters`` is a filter spec (see ``core.filters``), compiled here.
+    ``index`` and ``cache`` are passed on to ``purge_messages``.
+    ``resumed`` is the run row a resumed run was claimed with: its
+    checkpoints add on to the counts already stored there.
+    The run is capped to what is left of the guild's daily purge volume,
+    and its deletions are counted against it as they happen.
+    """
+    run_id = run_id or uuid.uuid4().hex
+    if correlation_id.get() is None:
+        # Purges started by a job log under the job's id; others (/purge,
+        # resumed runs) under their own.
+        correlation_id.set(run_id)
+    params = {
+        "limit": limit,
+        "before": _snowflake(before),
+        "after": _snowflake(after),
+        "oldest_first": oldest_first,
+        "filters": filters,
+    }
+    message_filter = MessageFilter(filters) if filters else None
+    guild_id = channel.guild.id
+    remaining = DAILY_PURGE_VOLUME - await store.guild_usage(guild_id)
+    if remaining <= 0:
+        log.warning("Skipping purge: the guild's daily purge volume is used up",
+                    extra={"run_id": run_id, "guild_id": guild_id,
+                           "channel_id": channel.id})
+        await store.finish_run(run_id)
+        return PurgeStats()
+    limit = remaining if limit is None else min(limit, remaining)
+    await store.start_run(run_id, guild_id, channel.id, params)
+    log.info("Purge run started", extra={
+        "run_id": run_id, "guild_id": guild_id, "channel_id": channel.id,
+        "limit": limit})
+    recorded = 0
+    # The run row's counts cover every attempt, since ``resume_runs``
+    # works out what is left of the original limit from them.
+    scanned_before = resumed["scanned"] if resumed else 0
+    deleted_before = resumed["deleted"] if resumed else 0
+
+    async def record_usage(stats):
+        nonlocal recorded
+        await store.add_guild_usage(guild_id, stats.deleted - recorded)
+        recorded = stats.deleted
+
+    async def checkpoint(last_message_id, stats):
+        await record_usage(stats)
+        if not await store.checkpoint_run(run_id, last_message_id,
+                                          scanned_before + stats.scanned,
+                                          deleted_before + stats.deleted):
+            # Our lease lapsed (the loop stalled past LEASE_TTL) and another
+            # replica resumed the run; stop rather than purge alongside it.
+            raise LeaseLost(run_id)
+
+    try:
+        stats = await purge_messages(channel, limit, limiter=limiter,
+                                     before=_snowflake_object(params["before"]),
+                                     after=_snowflake_object(params["after"]),
+                                     oldest_first=oldest_first, progress=progress,
+                                     checkpoint=checkpoint,
+                                     message_filter=message_filter, index=index,
+                                     cache=cache)
+    except (discord.Forbidden, discord.NotFound):
+        # Retrying after a restart can't fix a missing channel or permission.
+        await store.finish_run(run_id)
+        raise
+    except LeaseLost:
+        log.warning("Purge run was taken over by another process",
+                    extra={"run_id": run_id, "channel_id": channel.id})
+        return PurgeStats()
+    PURGE_DURATION.observe(stats.elapsed)
+    await record_usage(stats)
+    await store.finish_run(run_id)
+    log.info("Purge run finished", extra={
+        "run_id": run_id, "channel_id": channel.id, "scanned": stats.scanned,
+        "bulk_deleted": stats.bulk_deleted, "single_deleted": stats.single_deleted,
+        "elapsed": round(stats.elapsed, 3)})
+    return stats
+
+
+async def resume_runs(client, store, executor, owns=None, index=None):
+    """Restart purge runs interrupted by a shutdown from their checkpoint.
+
+    Only runs whose lease has expired are picked up, so a run another
+    replica is still working on is left alone. ``owns`` is an optional
+    predicate on guild ids; runs in guilds it rejects belong to another
+    shard's process.
+    """
+    for run in await store.orphaned_runs():
+        if owns is not None and not owns(run["guild_id"]):
+            continue
+        if not await store.claim_run(run["id"]):
+            continue  # Another replica got there first.
+        channel = client.get_channel(run["channel_id"])
+        if not isinstance(channel, discord.TextChannel):
+            await store.finish_run(run["id"])
+            continue
+        params = run["params"]
+        filters = params.get("filters")
+        limit = params["limit"]
+        if limit is not None:
+            # A filtered run's limit counts deletions, not messages scanned.
+            done = run["deleted"] if filters else run["scanned"]
+            limit = max(limit - done, 0)
+        before, after = params["before"], params["after"]
+        # The cursor moves in scan order: towards older messages unless the
+        # run was scanning oldest first.
+        if run["last_message_id"] is not None:
+            if params["oldest_first"]:
+                after = run["last_message_id"]
+            else:
+                before = run["last_message_id"]
+        with correlation(run["id"]):
+            log.info("Resuming purge run", extra={
+                "run_id": run["id"], "channel_id": channel.id,
+                "deleted": run["deleted"]})
+            future = executor.submit(channel.id, run_purge, store, channel, limit,
+                                     limiter=executor.limiter,
+                                     before=_snowflake_object(before),
+                                     after=_snowflake_object(after),
+                                     oldest_first=params["oldest_first"],
+                                     filters=filters, index=index, run_id=run["id"],
+                                     resumed=run)
+        future.add_done_callback(_report_resumed_run)
+
+
+def _report_resumed_run(future):
+    if not future.cancelled() and future.exception() is not None:
+        log.error("Error resuming purge run", exc_info=future.exception())
+
+
+def _snowflake(value):
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, discord.abc.Snowflake):
+        return value.id
+    return discord.utils.time_snowflake(value)
+
+
+def _snowflake_object(value):
+    return discord.Object(id=value) if value is not None else None
@@ -0,0 +1,21 @@
+# Per-guild limits, so one busy guild can't crowd out the others.
+
+# Scheduled jobs a guild may have at once, across all scheduler commands.
+MAX_JOBS_PER_GUILD = 100
+# Channels with a retention policy, per guild.
+MAX_RETENTION_POLICIES_PER_GUILD = 50
+# Messages a single scheduled job may purge per run.
+MAX_MESSAGES_PER_JOB = 10_000
+# Messages the bot will delete in one guild per UTC day, across immediate
+# and scheduled purges. Runs are capped to what is left.
+DAILY_PURGE_VOLUME = 250_000
+
+
+async def job_quota_error(store, guild_id: int, amount: int) -> str | None:
+    """Why a new job for ``guild_id`` would break a quota, or None if it fits."""
+    if amount > MAX_MESSAGES_PER_JOB:
+        return f"A scheduled purge can remove at most {MAX_MESSAGES_PER_JOB} messages."
+    if await store.count_guild_jobs(guild_id) >= MAX_JOBS_PER_GUILD:
+        return (f"This server already has {MAX_JOBS_PER_GUILD} scheduled purges. "
+                "Cancel one before adding another.")
+    return None
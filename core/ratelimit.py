@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+# Discord allows 50 requests per second per bot token across all routes;
+# stay a little under it so bursts from many channels never trip the global
+# limit.
+GLOBAL_RATE = 45
+
+# Per-route pacing. Bulk delete and history are bucketed per channel by
+# Discord; single deletes of other users' messages are far more restricted.
+ROUTE_RATES = {
+    "purge": (1, 1),
+    "history": (5, 5),
+    "bulk_delete": (1, 2),
+    "delete": (5, 5),
+    "send": (5, 5),
+}
+
+
+class TokenBucket:
+    """Classic token bucket; ``acquire`` waits until a token is available."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, retry_after: float):
+        # A 429 means our estimate was too generous; drain and back off.
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until,
+                                 time.monotonic() + retry_after)
+
+
+class RateLimiter:
+    """Global bucket plus one bucket per (route, channel) pair.
+
+    discord.py already honours the X-RateLimit headers of each response;
+    this limiter paces requests *before* they are sent so that many
+    concurrent purges share the budget instead of stampeding into 429s.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.routes = {}
+
+    def bucket(self, route: str, channel_id: int) -> TokenBucket:
+        key = (route, channel_id)
+        bucket = self.routes.get(key)
+        if bucket is None:
+            rate, capacity = ROUTE_RATES.get(route, (5, 5))
+            bucket = self.routes[key] = TokenBucket(rate, capacity)
+        return bucket
+
+    async def acquire(self, route: str, channel_id: int):
+        await self.bucket(route, channel_id).acquire()
+        await self.global_bucket.acquire()
+
+    def penalize(self, route: str, channel_id: int, retry_after: float,
+                 is_global: bool = False):
+        if is_global:
+            self.global_bucket.penalize(retry_after)
+        else:
+            self.bucket(route, channel_id).penalize(retry_after)
+
+    def forget(self, channel_id: int):
+        # Drop a channel's buckets once it goes idle so the map doesn't grow
+        # forever, but keep any that are still serving a 429 back-off.
+        now = time.monotonic()
+        for key in [key for key in self.routes if key[1] == channel_id]:
+            if self.routes[key].blocked_until <= now:
+                del self.routes[key]
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from core.triggers import trigger_for
+
+# What to do with occurrences that passed while the bot was offline (or
+# while the job was stuck behind a backlog):
+#   skip - drop them and wait for the next occurrence
+#   once - coalesce them into a single run
+#   all  - run each of them, up to the job's misfire limit
+MISFIRE_POLICIES = ("skip", "once", "all")
+DEFAULT_MISFIRE_LIMIT = 10
+# An occurrence this close to "now" counts as on time, not missed.
+MISFIRE_GRACE = timedelta(seconds=60)
+
+
+def misfire_policy(job) -> str:
+    # Recurring jobs have always skipped missed occurrences; one-shot jobs
+    # have always fired late rather than not at all.
+    return job.get("misfire") or ("skip" if trigger_for(job).recurring else "once")
+
+
+def catch_up(due_time: datetime, trigger, now: datetime,
+             policy: str, limit: int = DEFAULT_MISFIRE_LIMIT):
+    """Plan a due job's runs.
+
+    Returns ``(runs, missed, next_time)``: how many purges to run now, how
+    many occurrences were missed (beyond the grace window) and the next
+    future occurrence, or None for one-shot jobs. ``trigger`` is as
+    returned by ``trigger_for``.
+    """
+    due, latest, next_time = trigger.advance(due_time, now)
+    on_time = 1 if now - latest <= MISFIRE_GRACE else 0
+    missed = due - on_time
+    if policy == "all":
+        runs = min(due, max(limit, 1))
+    elif policy == "once":
+        runs = 1
+    else:
+        runs = on_time
+    return runs, missed, next_time
+
+
+def misfire_record(now: datetime, missed: int, policy: str, runs: int):
+    # Kept on the job so /view_purge_jobs can show what was coalesced.
+    return {
+        "detected_at": now.isoformat(),
+        "missed": missed,
+        "policy": policy,
+        "ran": runs,
+    }
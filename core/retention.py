@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+import discord
+
+from core.purge import delete_message_ids, run_purge
+from core.quotas import DAILY_PURGE_VOLUME
+
+log = logging.getLogger(__name__)
+
+# How often expired messages are swept, and how many one channel may
+# delete per sweep. Small, frequent batches keep deletions flowing at the
+# rate messages age out instead of in one burst per day.
+SWEEP_INTERVAL = 5.0
+SWEEP_BATCH = 100
+# Messages read from history to rebuild a channel's index on start; also
+# the largest max_count a policy may have.
+BACKFILL_LIMIT = 10_000
+# Seconds between attempts to catch up a channel whose index went stale.
+CATCH_UP_RETRY = 60.0
+
+
+class RetentionManager:
+    """Keeps channels with a retention policy trimmed continuously.
+
+    A policy sets a ``max_age`` (seconds), a ``max_count`` of messages, or
+    both, per channel. Each channel is pinned in the message index, which
+    gateway events keep current, and caught up from history on start. A
+    snowflake carries its send time, so the id alone answers "is this
+    older than the TTL". Every ``SWEEP_INTERVAL`` seconds
+    each channel's expired messages, at most ``SWEEP_BATCH`` of them, are
+    deleted by id on the purge executor. So retention shares the channel
+    queue and rate limiter with purges and never scans history again.
+
+    Like scheduled jobs, a channel is swept only by a process that owns
+    its guild (``scheduler.owns``), and among replicas of the same shards
+    only by the one holding the policy's lease (``JobStore.claim_retention``).
+    A retired scheduler stops sweeping along with firing jobs.
+    """
+
+    def __init__(self, client, store, executor, index, scheduler=None):
+        self.client = client
+        self.store = store
+        self.executor = executor
+        self.index = index
+        self.scheduler = scheduler
+        self.policies = {}
+        self._busy = set()
+        self._next_catch_up = {}
+        self._task = None
+
+    async def start(self):
+        if self._task is not None:
+            return
+        for policy in await self.store.retention_policies():
+            if self._owns(policy["guild_id"]):
+                self._activate(policy)
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def set_policy(self, policy):
+        await self.store.set_retention(policy)
+        self._activate(policy)
+
+    async def remove_policy(self, channel_id: int, guild_id: int | None = None) -> bool:
+        removed = await self.store.remove_retention(channel_id, guild_id)
+        if removed or guild_id is None:
+            self.policies.pop(channel_id, None)
+            self._next_catch_up.pop(channel_id, None)
+            self.index.unpin(channel_id)
+        return removed
+
+    def _owns(self, guild_id) -> bool:
+        return self.scheduler is None or self.scheduler.owns(guild_id)
+
+    def _activate(self, policy):
+        channel_id = policy["channel_id"]
+        self.policies[channel_id] = policy
+        if self.index.pin(channel_id).stale:
+            self._catch_up(channel_id)
+
+    def _catch_up(self, channel_id):
+        channel = self.client.get_channel(channel_id)
+        if isinstance(channel, discord.TextChannel) and channel_id not in self._busy:
+            self._busy.add(channel_id)
+            future = self.executor.submit(channel_id, self._backfill, channel)
+            future.add_done_callback(lambda future, channel_id=channel_id:
+                                     self._done(channel_id, future))
+
+    async def _backfill(self, channel):
+        """Bring the channel's index up to date from history.
+
+        Anything older than what the index covers is expired wholesale
+        when the oldest covered message already is: past the TTL, or
+        beyond ``max_count`` when ``BACKFILL_LIMIT`` messages are covered.
+        That one catch-up is a regular resumable purge run.
+        """
+        policy = self.policies.get(channel.id)
+        if policy is None or not await self.index.catch_up(channel, BACKFILL_LIMIT):
+            return  # Policy removed meanwhile.
+        oldest = self.index.get(channel.id).covered_from
+        if oldest == 0:
+            return  # The whole channel is indexed.
+        cutoff = _age_cutoff(policy)
+        if (policy.get("max_count") is not None
+                or (cutoff is not None and oldest < cutoff)):
+            if channel.id not in await self.store.claim_retention([channel.id]):
+                return  # Another replica sweeps this channel.
+            log.info("Purging retention overflow", extra={
+                "channel_id": channel.id, "before": oldest})
+            await run_purge(self.store, channel, None, limiter=self.executor.limiter,
+                            before=oldest)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception:
+                log.exception("Error sweeping retention policies")
+
+    async def sweep(self):
+        """Hand each held channel's expired messages to the executor for deletion."""
+        if self.scheduler is not None and self.scheduler.retired:
+            return
+        held = await self.store.claim_retention(
+            channel_id for channel_id, policy in self.policies.items()
+            if self._owns(policy["guild_id"]))
+        for channel_id in held:
+            policy = self.policies.get(channel_id)
+            if policy is None or channel_id in self._busy:
+                # Removed meanwhile, or the previous batch is still being deleted.
+                continue
+            entry = self.index.get(channel_id)
+            if entry is None or entry.stale:
+                # A new gateway session may have missed messages.
+                now = time.monotonic()
+                if now >= self._next_catch_up.get(channel_id, 0):
+                    self._next_catch_up[channel_id] = now + CATCH_UP_RETRY
+                    self.index.pin(channel_id)
+                    self._catch_up(channel_id)
+                continue
+            ids = self.index.expire(channel_id, _age_cutoff(policy),
+                                    policy.get("max_count"), SWEEP_BATCH)
+            if not ids:
+                continue
+            channel = self.client.get_channel(channel_id)
+            if not isinstance(channel, discord.TextChannel):
+                self.index.restore(channel_id, ids)
+                continue
+            self._busy.add(channel_id)
+            future = self.executor.submit(channel_id, self._expire, channel, ids)
+            future.add_done_callback(lambda future, channel_id=channel_id:
+                                     self._done(channel_id, future))
+
+    async def _expire(self, channel, ids):
+        guild_id = channel.guild.id
+        if await self.store.guild_usage(guild_id) >= DAILY_PURGE_VOLUME:
+            # Try again once the daily volume resets.
+            self.index.restore(channel.id, ids)
+            return
+        try:
+            stats = await delete_message_ids(channel, ids,
+                                             limiter=self.executor.limiter)
+        except BaseException:
+            # Also on cancellation at shutdown: ids left out of the index
+            # would never be expired. Any that did get deleted are skipped
+            # by Discord next time.
+            self.index.restore(channel.id, ids)
+            raise
+        await self.store.add_guild_usage(guild_id, stats.deleted)
+        log.debug("Expired messages", extra={
+            "channel_id": channel.id, "deleted": stats.deleted, "sample": 0.1})
+
+    def _done(self, channel_id, future):
+        self._busy.discard(channel_id)
+        _report_failure(future)
+
+
+def _age_cutoff(policy) -> int | None:
+    """The snowflake below which messages are past the policy's max age."""
+    if policy.get("max_age") is None:
+        return None
+    return discord.utils.time_snowflake(
+        discord.utils.utcnow() - timedelta(seconds=policy["max_age"]))
+
+
+def _report_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        log.error("Retention task failed", exc_info=future.exception())
@@ -0,0 +1,230 @@
+import calendar
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+WEEKDAY_NAMES = {"MON": 0, "TUE": 1, "WED": 2, "THU": 3, "FRI": 4, "SAT": 5, "SUN": 6}
+RRULE_DAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+MONTH_NAMES = {
+    name.upper(): number for number, name in enumerate(calendar.month_abbr) if name}
+
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+
+# A rule that matches nothing (e.g. "0 0 30 2 *") must not loop forever.
+# Leap-day rules repeat every 4 years, or 8 across a skipped century.
+MAX_SEARCH_YEARS = 9
+
+
+class CalendarRule:
+    """A calendar recurrence compiled to sorted field tables.
+
+    Cron expressions and RRULE strings both compile to this form. Finding
+    the next fire time jumps field by field (month, day, hour, minute) with
+    binary searches over the allowed values, so it costs at most a few
+    dozen steps instead of a minute-by-minute scan.
+
+    ``month_days``/``weekdays``/``nth_weekdays`` are None when the field is
+    unrestricted. With ``day_or`` set (cron semantics), a day matches if
+    either the month-day or the weekday restriction matches.
+    """
+
+    __slots__ = ("text", "minutes", "hours", "months", "month_days",
+                 "weekdays", "nth_weekdays", "day_or")
+
+    def __init__(self, text, minutes, hours, months, month_days=None,
+                 weekdays=None, nth_weekdays=None, day_or=False):
+        self.text = text
+        self.minutes = tuple(sorted(minutes))
+        self.hours = tuple(sorted(hours))
+        self.months = tuple(sorted(months))
+        self.month_days = frozenset(month_days) if month_days is not None else None
+        self.weekdays = frozenset(weekdays) if weekdays is not None else None
+        self.nth_weekdays = (frozenset(nth_weekdays) if nth_weekdays is not None
+                             else None)
+        self.day_or = day_or
+        if not (self.minutes and self.hours and self.months):
+            raise ValueError(f"Rule never fires: {text}")
+
+    def __repr__(self):
+        return f"CalendarRule({self.text!r})"
+
+    def matches_day(self, year, month, day) -> bool:
+        checks = []
+        if self.month_days is not None:
+            last = calendar.monthrange(year, month)[1]
+            checks.append(day in self.month_days or day - last - 1 in self.month_days)
+        if self.weekdays is not None or self.nth_weekdays is not None:
+            weekday = calendar.weekday(year, month, day)
+            ok = self.weekdays is not None and weekday in self.weekdays
+            if not ok and self.nth_weekdays is not None:
+                last = calendar.monthrange(year, month)[1]
+                ok = ((day - 1) // 7 + 1, weekday) in self.nth_weekdays or \
+                     (-((last - day) // 7 + 1), weekday) in self.nth_weekdays
+            checks.append(ok)
+        if not checks:
+            return True
+        return any(checks) if self.day_or else all(checks)
+
+    def next_local(self, after: datetime) -> datetime:
+        """Next matching naive wall-clock time strictly after ``after``."""
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        year, month, day = start.year, start.month, start.day
+        hour, minute = start.hour, start.minute
+        limit = start.year + MAX_SEARCH_YEARS
+        while year <= limit:
+            if month not in self.months:
+                index = bisect_left(self.months, month)
+                if index == len(self.months):
+                    year, month = year + 1, self.months[0]
+                else:
+                    month = self.months[index]
+                day, hour, minute = 1, 0, 0
+                continue
+            last = calendar.monthrange(year, month)[1]
+            while day <= last and not self.matches_day(year, month, day):
+                day, hour, minute = day + 1, 0, 0
+            if day > last:
+                year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+                day, hour, minute = 1, 0, 0
+                continue
+            hour_index = bisect_left(self.hours, hour)
+            if hour_index == len(self.hours):
+                day, hour, minute = day + 1, 0, 0
+                if day > last:
+                    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+                    day = 1
+                continue
+            if self.hours[hour_index] != hour:
+                hour, minute = self.hours[hour_index], 0
+            minute_index = bisect_left(self.minutes, minute)
+            if minute_index == len(self.minutes):
+                hour, minute = hour + 1, 0
+                continue
+            return datetime(year, month, day, hour, self.minutes[minute_index])
+        raise ValueError(f"Rule has no future occurrence: {self.text}")
+
+    def next_fire(self, after: datetime, tz=timezone.utc) -> datetime:
+        """Next fire time after the aware datetime ``after``, as UTC."""
+        local = after.astimezone(tz).replace(tzinfo=None)
+        return self.next_local(local).replace(tzinfo=tz).astimezone(timezone.utc)
+
+
+def _parse_field(text, low, high, names=None):
+    values = set()
+    for part in text.upper().split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid step in {text!r}")
+        if part == "*":
+            start, end = low, high
+        else:
+            bounds = [names[p] if names and p in names else int(p)
+                      for p in part.split("-", 1)]
+            start = bounds[0]
+            end = bounds[1] if len(bounds) > 1 else (high if step > 1 else start)
+        if not (low <= start <= high and low <= end <= high) or start > end:
+            raise ValueError(f"Value out of range in {text!r}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(text: str) -> CalendarRule:
+    expression = CRON_ALIASES.get(text.strip().lower(), text)
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(
+            "Cron expressions need 5 fields: minute hour day month weekday")
+    minute, hour, day, month, weekday = fields
+    # Cron counts Sunday as 0 (or 7); Python's weekday() has Monday as 0.
+    cron_weekdays = {
+        "SUN": 0, "MON": 1, "TUE": 2, "WED": 3, "THU": 4, "FRI": 5, "SAT": 6}
+    weekdays = None
+    if weekday != "*":
+        weekdays = {(value - 1) % 7
+                    for value in _parse_field(weekday, 0, 7, cron_weekdays)}
+    return CalendarRule(
+        text,
+        minutes=_parse_field(minute, 0, 59),
+        hours=_parse_field(hour, 0, 23),
+        months=_parse_field(month, 1, 12, MONTH_NAMES),
+        month_days=_parse_field(day, 1, 31) if day != "*" else None,
+        weekdays=weekdays,
+        day_or=day != "*" and weekday != "*",
+    )
+
+
+def parse_rrule(text: str) -> CalendarRule:
+    parts = {}
+    for item in text.upper().removeprefix("RRULE:").split(";"):
+        if item:
+            key, _, value = item.partition("=")
+            parts[key.strip()] = value.strip()
+    frequency = parts.pop("FREQ", None)
+    if frequency not in ("HOURLY", "DAILY", "WEEKLY", "MONTHLY", "YEARLY"):
+        raise ValueError("RRULE needs FREQ=HOURLY, DAILY, WEEKLY, MONTHLY or YEARLY")
+
+    def numbers(key, low, high, signed=False):
+        # Only BYMONTHDAY may count back from the end (-1 is the last day).
+        if key not in parts:
+            return None
+        values = {int(v) for v in parts.pop(key).split(",")}
+        if any(not (low <= (abs(v) if signed else v) <= high) for v in values):
+            raise ValueError(f"{key} out of range")
+        return values
+
+    minutes = numbers("BYMINUTE", 0, 59)
+    hours = numbers("BYHOUR", 0, 23)
+    months = numbers("BYMONTH", 1, 12)
+    month_days = numbers("BYMONTHDAY", 1, 31, signed=True)
+    weekdays = nth_weekdays = None
+    if "BYDAY" in parts:
+        for item in parts.pop("BYDAY").split(","):
+            ordinal, name = item[:-2], item[-2:]
+            if name not in RRULE_DAYS:
+                raise ValueError(f"Unknown BYDAY value {item!r}")
+            if ordinal:
+                if (frequency not in ("MONTHLY", "YEARLY")
+                        or not 1 <= abs(int(ordinal)) <= 5):
+                    raise ValueError(f"Invalid BYDAY ordinal {item!r}")
+                nth_weekdays = ((nth_weekdays or set())
+                                | {(int(ordinal), RRULE_DAYS[name])})
+            else:
+                weekdays = (weekdays or set()) | {RRULE_DAYS[name]}
+    if parts:
+        raise ValueError(f"Unsupported RRULE parts: {', '.join(sorted(parts))}")
+
+    # Fields finer than the frequency default to the start of the period,
+    # as with an RRULE whose DTSTART falls on the hour.
+    if minutes is None:
+        minutes = {0}
+    if hours is None:
+        hours = set(range(24)) if frequency == "HOURLY" else {0}
+    if frequency == "WEEKLY" and weekdays is None:
+        weekdays = {0}
+    if frequency in ("MONTHLY", "YEARLY") and month_days is None \
+            and weekdays is None and nth_weekdays is None:
+        month_days = {1}
+    if months is None:
+        months = {1} if frequency == "YEARLY" else set(range(1, 13))
+    return CalendarRule(text, minutes, hours, months, month_days,
+                        weekdays, nth_weekdays)
+
+
+@lru_cache(maxsize=1024)
+def compile_rule(text: str) -> CalendarRule:
+    """Compile a cron expression or RRULE string once and reuse it."""
+    text = text.strip()
+    if "FREQ=" in text.upper():
+        return parse_rrule(text)
+    return parse_cron(text)
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+import discord
+
+from core.jobstore import LEASE_TTL, job_timestamp, parse_scheduled_time
+from core.logs import correlation, correlation_id
+from core.metrics import SCHEDULED_JOBS, SCHEDULER_LAG
+from core.purge import resume_runs, run_purge
+from core.recurrence import (
+    DEFAULT_MISFIRE_LIMIT,
+    catch_up,
+    misfire_policy,
+    misfire_record,
+)
+from core.sharding import shard_for_guild
+from core.timer import JobTimer
+from core.triggers import trigger_for
+
+# Job files from before the job store, imported once on first start. The
+# value is the store's source label for jobs created by that front-end.
+LEGACY_JOB_FILES = {
+    "purgejobs.json": "schedule",
+    "minutepurge.json": "minutes",
+}
+# Meta key holding the shard count of the most recently started process.
+SHARD_COUNT_KEY = "shard_count"
+# Lease heartbeat and store resync period; well inside LEASE_TTL so a live
+# process never loses a lease between renewals.
+SYNC_INTERVAL = LEASE_TTL / 3
+
+log = logging.getLogger(__name__)
+
+
+class SchedulerCore:
+    """The bot's single scheduler: one store, one timer, one executor.
+
+    Every scheduled purge, whichever command created it, is a job dict in
+    the store and an entry in the timer. When a job comes due its trigger
+    (see ``core.triggers``) decides how many purges to run and when the job
+    fires next, and the purges are queued on the executor.
+
+    When the bot runs sharded across several processes, each process only
+    loads and fires the jobs of guilds on its own shards (``owns``), so
+    every job fires in exactly one place.
+
+    Replicas of the same shards may also run side by side against one
+    store. Each loads every job into its own timer, and whichever claims
+    a due job first (``JobStore.claim_job``) runs it. A periodic sync
+    renews this process's leases, picks up jobs other replicas added,
+    advanced or cancelled, and resumes purge runs left by a dead replica.
+    """
+
+    def __init__(self, client, store, executor, index=None):
+        self.client = client
+        self.store = store
+        self.executor = executor
+        # Optional MessageIndex; purges use it before reading history.
+        self.index = index
+        self.timer = JobTimer(self.run_job)
+        SCHEDULED_JOBS.set_function(lambda: len(self.timer))
+        self.loaded = False
+        self.retired = False
+        # Jobs claimed and not yet rescheduled, and jobs whose timer entry
+        # changed since sync last read the store; sync leaves both alone.
+        self._claimed = set()
+        self._touched = set()
+        self._sync_task = None
+
+    async def start(self, resolve_guild):
+        """
+        Import legacy job files, resume interrupted purge runs and load the
+        stored jobs into the timer. Jobs missed while offline are due
+        immediately, and run_job applies each one's misfire policy. The timer
+        is authoritative once loaded, so later calls (on reconnect) are no-ops.
+        """
+        if self.loaded:
+            return
+        # The newest process's shard count wins: processes started with an
+        # older count stop firing jobs (see run_job) and the new layout's
+        # processes take over their guilds.
+        await self.store.set_meta(SHARD_COUNT_KEY, str(self.client.shard_count))
+        for path, source in LEGACY_JOB_FILES.items():
+            await self.store.import_json(path, source)
+        # Jobs stored before jobs were keyed by guild only have a channel id.
+        await self.store.backfill_guild_ids(resolve_guild)
+        await resume_runs(self.client, self.store, self.executor, self.owns,
+                          index=self.index)
+        for job in await self.store.all_jobs():
+            if self.owns(job.get("guild_id")):
+                self.timer.schedule(job["id"], job_timestamp(job))
+        self.loaded = True
+        self.timer.start()
+        self._sync_task = asyncio.create_task(self._sync_loop())
+
+    def stop(self):
+        self.timer.stop()
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(SYNC_INTERVAL)
+            try:
+                await self.sync()
+            except Exception:
+                log.exception("Error syncing the purge scheduler")
+
+    async def sync(self):
+        if not await self.still_current():
+            return
+        await self.store.renew_leases()
+        # Make the timer match the store. Jobs whose time has passed are
+        # loaded as due; if another replica holds them, claim_job fails and
+        # the next sync tries again once that lease has expired. A job this
+        # process ran, added or removed while the store was being read is
+        # already current in the timer, and newer than what was read.
+        self._touched.clear()
+        job_times = await self.store.job_times()
+        skip = self._claimed | self._touched
+        stored = set()
+        for job_id, guild_id, next_run_time in job_times:
+            if self.owns(guild_id):
+                stored.add(job_id)
+                if job_id not in skip and self.timer.deadline(job_id) != next_run_time:
+                    self.timer.schedule(job_id, next_run_time)
+        for job_id in set(self.timer.keys()) - stored - skip:
+            self.timer.cancel(job_id)
+        await resume_runs(self.client, self.store, self.executor, self.owns,
+                          index=self.index)
+
+    def owns(self, guild_id) -> bool:
+        shard_ids = self.client.shard_ids
+        if shard_ids is None:
+            return True  # This process runs every shard.
+        if guild_id is None:
+            # Not yet backfilled (see start); shard 0's process keeps these.
+            return 0 in shard_ids
+        return shard_for_guild(guild_id, self.client.shard_count) in shard_ids
+
+    async def still_current(self) -> bool:
+        """Whether this process's shard layout is still the live one."""
+        if self.retired:
+            return False
+        current = await self.store.get_meta(SHARD_COUNT_KEY)
+        if current is not None and current != str(self.client.shard_count):
+            log.warning("Shard count changed; this process stops firing jobs"
+                        " until restarted",
+                        extra={"shard_count": self.client.shard_count,
+                               "current_shard_count": current})
+            self.retired = True
+            self.stop()
+            return False
+        return True
+
+    async def add_job(self, job, source: str):
+        await self.store.add_job(job, source)
+        self._touched.add(job["id"])
+        # A guild's commands arrive on its own shard, so this is the
+        # owning process unless the job was created for another guild.
+        if self.owns(job.get("guild_id")):
+            self.timer.schedule(job["id"], job_timestamp(job))
+        with correlation(job["id"]):
+            log.info("Job scheduled", extra={
+                "source": source, "guild_id": job.get("guild_id"),
+                "channel_id": job["channel_id"],
+                "scheduled_time": job["scheduled_time"]})
+        return job
+
+    async def remove_job(self, job_id, guild_id) -> bool:
+        # Scoped to the guild so one server can never cancel another's jobs.
+        if not await self.store.remove_job(job_id, guild_id):
+            return False
+        self._touched.add(job_id)
+        self.timer.cancel(job_id)
+        return True
+
+    async def list_jobs(self, guild_id, channel_id=None, after=None, limit=10):
+        return await self.store.list_jobs(guild_id, channel_id, after=after,
+                                          limit=limit)
+
+    async def run_job(self, job_id):
+        """
+        Called by the timer at the job's scheduled second: queue the job's
+        next occurrence (or drop it), then purge the channel. Advancing first
+        means a purge interrupted by a restart is resumed from its checkpoint
+        instead of the job firing a second time.
+        """
+        # The timer runs each job in its own task, so this only tags this
+        # job's logs: its claim, the purges it queues and its reschedule.
+        correlation_id.set(job_id)
+        if not await self.still_current():
+            return
+        # None if the job was cancelled, advanced by another replica, or is
+        # being run by one right now.
+        job = await self.store.claim_job(job_id)
+        if job is None:
+            log.debug("Job not claimed")
+            return
+        self._claimed.add(job_id)
+        try:
+            runs = await self._advance(job)
+        finally:
+            self._claimed.discard(job_id)
+            self._touched.add(job_id)
+        if runs is None:
+            return
+
+        channel = self.client.get_channel(job["channel_id"])
+        if isinstance(channel, discord.TextChannel) and runs:
+            try:
+                # Runs alongside purges for other channels, but queues behind
+                # any purge already running in this one.
+                for _ in range(runs):
+                    await self.executor.submit(channel.id, run_purge, self.store,
+                                               channel, job["amount"],
+                                               limiter=self.executor.limiter,
+                                               filters=job.get("filters"),
+                                               index=self.index)
+                log.info("Job purges finished", extra={
+                    "channel_id": channel.id, "runs": runs, "amount": job["amount"]})
+            except discord.HTTPException:
+                log.exception("Error purging channel", extra={"channel_id": channel.id})
+
+    async def _advance(self, job):
+        """Store a claimed job's next occurrence, or drop it if it has none.
+
+        Returns how many purges to run now, or None if the job was lost.
+        """
+        job_id = job["id"]
+        now = datetime.now(timezone.utc)
+        lag = now.timestamp() - job_timestamp(job)
+        SCHEDULER_LAG.observe(lag)
+        log.info("Job claimed", extra={"lag": round(lag, 3)})
+        policy = misfire_policy(job)
+        runs, missed, next_time = catch_up(
+            parse_scheduled_time(job["scheduled_time"]),
+            trigger_for(job), now, policy,
+            job.get("misfire_limit", DEFAULT_MISFIRE_LIMIT))
+        if missed:
+            job["last_misfire"] = misfire_record(now, missed, policy, runs)
+            log.warning("Job missed purges", extra={
+                "missed": missed, "policy": policy, "runs": runs})
+        if next_time is None:
+            await self.store.remove_job(job_id)
+            log.info("Job finished")
+        else:
+            next_job = dict(job, scheduled_time=next_time.isoformat())
+            if not await self.store.update_job(next_job):
+                # Cancelled meanwhile, or our lease lapsed and another
+                # replica claimed the job; it runs the purge, not us.
+                log.warning("Job lost before it was rescheduled; skipping its purge")
+                return None
+            self.timer.schedule(job_id, job_timestamp(next_job))
+            log.info("Job rescheduled",
+                     extra={"scheduled_time": next_job["scheduled_time"]})
+        return runs
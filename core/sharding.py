@@ -0,0 +1,32 @@
+import os
+
+
+def shard_config(environ=os.environ):
+    """``(shard_count, shard_ids)`` for this process.
+
+    Read from ``SHARD_COUNT`` and ``SHARD_IDS`` (comma separated, e.g.
+    ``"0,1"``). With neither set, discord.py picks the shard count and this
+    process runs every shard, as before. Setting only ``SHARD_COUNT`` also
+    runs every shard, at that count.
+    """
+    count = environ.get("SHARD_COUNT")
+    ids = environ.get("SHARD_IDS")
+    if not count:
+        if ids:
+            raise ValueError("SHARD_IDS needs SHARD_COUNT to be set as well")
+        return None, None
+    shard_count = int(count)
+    if shard_count < 1:
+        raise ValueError("SHARD_COUNT must be at least 1")
+    if not ids:
+        return shard_count, None
+    shard_ids = sorted({int(shard_id) for shard_id in ids.split(",")
+                        if shard_id.strip()})
+    if not shard_ids or shard_ids[0] < 0 or shard_ids[-1] >= shard_count:
+        raise ValueError(f"SHARD_IDS must be between 0 and {shard_count - 1}")
+    return shard_count, shard_ids
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    # Discord's own routing: the gateway sends a guild's events to this shard.
+    return (guild_id >> 22) % shard_count
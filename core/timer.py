@@ -0,0 +1,135 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Upper bound on a single sleep so that wall-clock adjustments (NTP, VM
+# suspend) are noticed without polling.
+MAX_SLEEP = 3600
+
+
+class JobTimer:
+    """Min-heap of job deadlines that sleeps until the earliest one is due.
+
+    Entries are keyed by job id. Rescheduling or cancelling a key invalidates
+    its heap entry in place (lazy deletion) and wakes the runner so it can
+    recompute how long to sleep. Due keys are handed to ``callback`` as
+    background tasks so a slow job never delays the next deadline.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._stale = 0
+        self._wakeup = asyncio.Event()
+        self._runner = None
+        self._running = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def deadline(self, key):
+        """When ``key`` is due, or None if it isn't scheduled."""
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def keys(self):
+        return list(self._entries)
+
+    def schedule(self, key, when: float):
+        """Schedule ``key`` to fire at the POSIX timestamp ``when``."""
+        self._invalidate(key)
+        entry = [when, next(self._counter), key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        if self._invalidate(key):
+            self._wakeup.set()
+
+    def clear(self):
+        self._heap.clear()
+        self._entries.clear()
+        self._stale = 0
+        self._wakeup.set()
+
+    def next_deadline(self):
+        self._drop_stale_head()
+        return self._heap[0][0] if self._heap else None
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        for task in self._running:
+            task.cancel()
+
+    def _invalidate(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[2] = None
+        self._stale += 1
+        # Rebuild once stale entries dominate so cancelled jobs can't make
+        # the heap grow without bound.
+        if self._stale > 64 and self._stale > len(self._entries):
+            self._heap = [e for e in self._heap if e[2] is not None]
+            heapq.heapify(self._heap)
+            self._stale = 0
+        return True
+
+    def _drop_stale_head(self):
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+            self._stale -= 1
+
+    def _pop_due(self, now):
+        due = []
+        self._drop_stale_head()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, key = heapq.heappop(self._heap)
+            del self._entries[key]
+            due.append(key)
+            self._drop_stale_head()
+        return due
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            if deadline is None:
+                await self._wakeup.wait()
+                continue
+            delay = deadline - time.time()
+            if delay > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(),
+                                           timeout=min(delay, MAX_SLEEP))
+                # Either the queue changed or we slept; re-evaluate the head.
+                if self._wakeup.is_set() or time.time() < deadline:
+                    continue
+            for key in self._pop_due(time.time()):
+                task = asyncio.create_task(self._fire(key))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+    async def _fire(self, key):
+        try:
+            await self.callback(key)
+        except Exception:
+            log.exception("Error running scheduled job", extra={"job_id": key})
@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+@lru_cache(maxsize=None)
+def resolve_timezone(name: str | None):
+    """ZoneInfo for ``name``, cached; unknown or missing names mean UTC."""
+    if not name:
+        return timezone.utc
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.utc
+
+
+def localize(wall_time: datetime, tz) -> datetime:
+    """Interpret a naive wall-clock time in ``tz`` and return it in UTC.
+
+    Follows PEP 495: an ambiguous time (clocks going back) resolves to its
+    first occurrence, and a time skipped by clocks going forward lands the
+    same distance past the jump (02:30 becomes 03:30).
+    """
+    return wall_time.replace(tzinfo=tz).astimezone(timezone.utc)
+
+
+def to_wall_time(moment: datetime, tz) -> datetime:
+    return moment.astimezone(tz).replace(tzinfo=None)
+
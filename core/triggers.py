@@ -0,0 +1,161 @@
+from datetime import datetime, time, timedelta
+
+from core.rules import compile_rule
+from core.timezones import localize, resolve_timezone, to_wall_time
+
+INTERVALS = {
+    "daily": timedelta(days=1),
+    "hourly": timedelta(hours=1),
+    "by minute": timedelta(minutes=1),
+    "weekly": timedelta(weeks=1),
+    "biweekly": timedelta(weeks=2),
+}
+
+# Calendar rules have no fixed period, so missed occurrences are counted by
+# stepping through them; stop counting past this many.
+MAX_COUNTED_MISSES = 1000
+
+TRIGGER_TYPES = {}
+
+
+def register_trigger(name):
+    """Class decorator adding a trigger type under ``name``.
+
+    A trigger is built from a job dict with ``from_job(job)`` and answers
+    ``advance(due_time, now)`` with ``(due, latest, next_time)``: how many
+    occurrences from ``due_time`` up to ``now`` are due, the most recent of
+    them, and the first one after ``now`` (None once the job is finished).
+    """
+    def decorator(cls):
+        cls.name = name
+        TRIGGER_TYPES[name] = cls
+        return cls
+    return decorator
+
+
+@register_trigger("date")
+class OneShotTrigger:
+    """Fires once at the job's scheduled time."""
+
+    __slots__ = ()
+    recurring = False
+
+    @classmethod
+    def from_job(cls, job):  # noqa: ARG003 - the trigger interface
+        return cls()
+
+    def advance(self, due_time, now):  # noqa: ARG002 - the trigger interface
+        return 1, due_time, None
+
+    def describe(self) -> str:
+        return "No"
+
+
+@register_trigger("interval")
+class IntervalTrigger:
+    """Every ``interval`` of elapsed time, regardless of timezone."""
+
+    __slots__ = ("interval",)
+    recurring = True
+
+    def __init__(self, interval: timedelta):
+        self.interval = interval
+
+    @classmethod
+    def from_job(cls, job):
+        if job.get("recurrence_minutes"):
+            return cls(timedelta(minutes=job["recurrence_minutes"]))
+        interval = INTERVALS[job["recurrence"]]
+        if interval >= timedelta(days=1) and job.get("local_time"):
+            return WallClockTrigger(interval, resolve_timezone(job.get("timezone")),
+                                    time.fromisoformat(job["local_time"]))
+        return cls(interval)
+
+    def advance(self, due_time, now):
+        due = max((now - due_time) // self.interval + 1, 1)
+        next_time = due_time + due * self.interval
+        return due, next_time - self.interval, next_time
+
+    def describe(self) -> str:
+        for name, interval in INTERVALS.items():
+            if interval == self.interval:
+                return f"Yes - {name.capitalize()}"
+        return f"Yes - Every {int(self.interval.total_seconds() // 60)} minutes"
+
+
+class WallClockTrigger(IntervalTrigger):
+    """Whole-day intervals that keep the same local wall-clock time.
+
+    Arithmetic happens on naive local datetimes, so a daily 03:00 purge
+    stays at 03:00 across DST changes instead of drifting by an hour.
+    """
+
+    __slots__ = ("tz", "wall_time")
+
+    def __init__(self, interval: timedelta, tz, wall_time: time):
+        super().__init__(interval)
+        self.tz = tz
+        self.wall_time = wall_time
+
+    def advance(self, due_time, now):
+        # Re-apply the intended wall time in case due_time was pushed out
+        # of a DST gap (02:30 -> 03:30) when it was localized.
+        base = datetime.combine(to_wall_time(due_time, self.tz).date(), self.wall_time)
+        due = max((to_wall_time(now, self.tz) - base) // self.interval + 1, 1)
+        next_time = localize(base + due * self.interval, self.tz)
+        while next_time <= now:
+            # Around a DST change the local estimate can be one short.
+            due += 1
+            next_time = localize(base + due * self.interval, self.tz)
+        return due, localize(base + (due - 1) * self.interval, self.tz), next_time
+
+
+@register_trigger("calendar")
+class CalendarTrigger:
+    """A compiled cron/RRULE rule evaluated in the job's timezone."""
+
+    __slots__ = ("rule", "tz")
+    recurring = True
+
+    def __init__(self, rule, tz):
+        self.rule = rule
+        self.tz = tz
+
+    @classmethod
+    def from_job(cls, job):
+        return cls(compile_rule(job["rule"]), resolve_timezone(job.get("timezone")))
+
+    def next_fire(self, after: datetime) -> datetime:
+        return self.rule.next_fire(after, self.tz)
+
+    def advance(self, due_time, now):
+        due, latest, next_time = 1, due_time, self.next_fire(due_time)
+        while next_time <= now and due <= MAX_COUNTED_MISSES:
+            due, latest = due + 1, next_time
+            next_time = self.next_fire(next_time)
+        if next_time <= now:
+            # Too many to count: jump straight to the next future one, and
+            # only count the latest as on time if it is within a minute.
+            recent = self.next_fire(now - timedelta(seconds=60))
+            latest = recent if recent <= now else due_time
+            next_time = self.next_fire(now)
+        return due, latest, next_time
+
+    def describe(self) -> str:
+        return f"Yes - Custom ({self.rule.text})"
+
+
+def trigger_name(job) -> str:
+    # Jobs from before triggers were explicit are recognised by their
+    # recurrence fields.
+    if job.get("trigger"):
+        return job["trigger"]
+    if job.get("rule"):
+        return "calendar"
+    if job.get("recurring") or job.get("recurrence", "none") in INTERVALS:
+        return "interval"
+    return "date"
+
+
+def trigger_for(job):
+    return TRIGGER_TYPES[trigger_name(job)].from_job(job)
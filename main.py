@@ -1,69 +1,225 @@
+import asyncio
+import logging
 import os
 import platform
-import time
 
 import discord
-from colorama import Back, Fore, Style
 from discord.ext import commands
 
+from core.commandsync import sync_if_changed
+from core.executor import PurgeExecutor
+from core.jobstore import JobStore
+from core.logs import setup_logging
+from core.message_index import MessageIndex
+from core.metrics import QUEUE_DEPTH, http_trace, start_metrics_server
+from core.preferences import PreferenceStore
+from core.preview import HistoryCache
+from core.profiles import active_profile, bot_options, memory_report
+from core.profiling import (
+  LoopWatchdog,
+  TimedCommandTree,
+  observe_command,
+  profiling_enabled,
+  slow_callback_threshold,
+)
+from core.retention import RetentionManager
+from core.scheduler import SchedulerCore
+from core.sharding import shard_config
+
+# JSON lines to logs/purgebot.log and stderr, written off the event loop.
+log_listener = setup_logging()
+log = logging.getLogger("purgebot")
+
 #
 # Start of bot code
-client = commands.Bot(command_prefix='.', intents=discord.Intents.all())
+# SHARD_COUNT / SHARD_IDS split the bot across processes; each process
+# then runs only the scheduled jobs of guilds on its shards.
+shard_count, shard_ids = shard_config()
+# BOT_PROFILE=full restores every intent and cache; the default "lean"
+# profile keeps only what the cogs use (see core/profiles.py).
+profile = active_profile()
+client = commands.AutoShardedBot(command_prefix='.', shard_count=shard_count,
+                                 shard_ids=shard_ids, http_trace=http_trace(),
+                                 tree_cls=TimedCommandTree, **bot_options(profile))
+client.profile = profile
+
+
+# Needed to run and manage purges; loaded before the bot connects.
+CORE_COGS = [
+    "cogs.PurgeBot",
+    "cogs.SchedulePurge",
+    "cogs.MinutesPurge",
+    "cogs.SetTimezone",
+    "cogs.Diagnostics",
+    "cogs.Retention",
+]
+# Everything else is loaded once the bot is ready.
+DEFERRED_COGS = [
+    "cogs.MakeMessages",
+    "cogs.DisplayTime",
+    "cogs.BotTest",
+    "cogs.Feedback",
+]
+
+
+async def load_cog(cog):
+  # One broken cog must not stop the others from loading.
+  try:
+    await client.load_extension(cog)
+  except Exception:
+    log.exception("Failed to load extension", extra={"cog": cog})
+
+
+async def load_cogs(cogs):
+  await asyncio.gather(*(load_cog(cog) for cog in cogs))
+
+
+async def index_message(message):
+  client.message_index.track(message)
+
+
+async def unindex_message(payload):
+  client.message_index.forget(payload.channel_id, (payload.message_id,))
+
+
+async def unindex_messages(payload):
+  client.message_index.forget(payload.channel_id, payload.message_ids)
+
+
+async def invalidate_index(_shard_id):
+  # A new gateway session (not a resume) may have missed message events.
+  client.message_index.invalidate()
 
 
 async def setup_hook():
   #await client.tree.sync(guild=discord.Object(id='383365467894710272'))
-  current_cog = None
-  try:
-    for cog in [
-        "cogs.MakeMessages",
-        "cogs.PurgeBot",
-        "cogs.DisplayTime",
-        "cogs.SchedulePurge",
-        "cogs.MinutesPurge",
-        "cogs.BotTest",
-        "cogs.SetTimezone",
-        "cogs.Feedback",
-    ]:
-      current_cog = cog
-      await client.load_extension(cog)
-  except Exception as e:
-    if current_cog:
-      print(f"Failed to load extension {current_cog}:", e)
-    else:
-      print("Failed to load a cog due to an error before loading:", e)
+  # Shared by the scheduler cogs, so it must be open before they load.
+  client.job_store = JobStore("purgejobs.sqlite")
+  await client.job_store.open()
+  client.purge_executor = PurgeExecutor()
+  client.purge_executor.start()
+  QUEUE_DEPTH.set_function(lambda: client.purge_executor.queue_depth)
+  # Ids of recent messages, so purges and retention can skip reading history.
+  client.message_index = MessageIndex(os.getenv("MESSAGE_INDEX", "message_index.bin"))
+  await client.message_index.load()
+  client.message_index.start()
+  client.add_listener(index_message, "on_message")
+  client.add_listener(unindex_message, "on_raw_message_delete")
+  client.add_listener(unindex_messages, "on_raw_bulk_message_delete")
+  client.add_listener(invalidate_index, "on_shard_connect")
+  # History read by /purge_preview, reused when the purge is confirmed.
+  client.history_cache = HistoryCache()
+  client.scheduler = SchedulerCore(client, client.job_store, client.purge_executor,
+                                   index=client.message_index)
+  client.retention = RetentionManager(client, client.job_store, client.purge_executor,
+                                      client.message_index, scheduler=client.scheduler)
+  client.preferences = PreferenceStore("userpreferences.json")
+  await client.preferences.load()
+  await load_cogs(CORE_COGS)
+  # Local only: scrape http://127.0.0.1:9108/metrics. METRICS_PORT=0 disables it.
+  metrics_port = int(os.getenv("METRICS_PORT", "9108"))
+  if metrics_port:
+    try:
+      client.metrics_server = await start_metrics_server("127.0.0.1", metrics_port)
+    except OSError:
+      log.exception("Could not start the metrics endpoint",
+                    extra={"port": metrics_port})
+  # PROFILING=1 logs the stack of anything blocking the event loop for
+  # longer than SLOW_CALLBACK_MS (default 250).
+  if profiling_enabled():
+    client.watchdog = LoopWatchdog(slow_callback_threshold())
+    client.watchdog.start()
 
 
 client.setup_hook = setup_hook
+_close = client.close
+
+
+async def close():
+  if hasattr(client, "scheduler"):
+    client.scheduler.stop()
+  if hasattr(client, "retention"):
+    client.retention.stop()
+  if hasattr(client, "message_index"):
+    client.message_index.stop()
+    try:
+      await client.message_index.save()
+    except OSError:
+      log.exception("Error saving the message index")
+  # Write out any preference changes still waiting for their batch.
+  if hasattr(client, "preferences"):
+    await client.preferences.flush()
+  if hasattr(client, "job_store"):
+    await client.job_store.close()
+  if hasattr(client, "metrics_server"):
+    await client.metrics_server.cleanup()
+  if hasattr(client, "watchdog"):
+    client.watchdog.stop()
+  await _close()
+
+
+client.close = close
+
+
+def channel_guild_id(channel_id):
+  channel = client.get_channel(channel_id)
+  guild = getattr(channel, "guild", None)
+  return guild.id if guild is not None else None
 
 
 @client.event
 async def on_ready():
-  schedule_purge_cog = client.get_cog("SchedulePurge")
-  if schedule_purge_cog and hasattr(schedule_purge_cog, 'update_missed_purge_jobs'):
-      await schedule_purge_cog.update_missed_purge_jobs()
-  else:
-        print("The 'SchedulePurge' cog is not loaded or 'update_missed_purge_jobs' is not available.")
-    
-  prfx = (Back.BLACK + Fore.GREEN +
-          time.strftime("%H:%M:%S UTC", time.gmtime()) + Back.RESET +
-          Fore.WHITE + Style.BRIGHT)
+  # Only the first on_ready does anything; reconnects keep the running timer.
+  try:
+    await client.scheduler.start(channel_guild_id)
+  except Exception:
+    log.exception("Error starting the purge scheduler")
+  try:
+    await client.retention.start()
+  except Exception:
+    log.exception("Error starting retention policies")
+
+  # on_ready also fires after reconnects; the cogs and commands stay put.
+  first_ready = not getattr(client, "started", False)
+  client.started = True
+
   if client is not None and client.user is not None:
-    print(prfx + " Logged in as " + Fore.YELLOW + client.user.name)
-    print(prfx + " Bot ID " + Fore.YELLOW + str(client.user.id))
-    print(prfx + " Discord Version " + Fore.YELLOW + discord.__version__)
-    python_version_msg = (prfx + " Python Version " + Fore.YELLOW +
-                          str(platform.python_version()))
-    print(python_version_msg)
-    synced = await client.tree.sync()
-    print(f"{prfx} Slash CMDs Synced {Fore.YELLOW}{len(synced)} Commands")
-    print(prfx + " Current Working Directory:" + Fore.YELLOW + os.getcwd())
-    print(prfx + " Bot is Logged in and ready")
+    report = memory_report(client)
+    log.info("Bot is logged in and ready", extra={
+        "user": client.user.name,
+        "bot_id": client.user.id,
+        "discord_version": discord.__version__,
+        "python_version": platform.python_version(),
+        "cwd": os.getcwd(),
+        "profile": profile,
+        "rss_bytes": report["rss_bytes"],
+        "guilds": report["guilds"],
+    })
+
+  if first_ready:
+    await load_cogs(DEFERRED_COGS)
+    # The hash covers every cog's commands, so sync after the deferred ones.
+    try:
+      synced = await sync_if_changed(client.tree, client.job_store)
+    except discord.HTTPException:
+      log.exception("Error syncing slash commands")
+    else:
+      if synced is None:
+        log.info("Slash commands unchanged, sync skipped")
+      else:
+        log.info("Slash commands synced", extra={"commands": len(synced)})
+
+
+@client.event
+async def on_app_command_completion(interaction, _command):
+  observe_command(interaction)
 
 
 # Checks to make sure the token is loaded properly for Discord
 token = os.getenv("TOKEN")
 if token is not None:
-  client.run(token)
+  # log_handler=None: discord.py logs through the queue set up above.
+  client.run(token, log_handler=None)
 else:
-  print("Token not loaded properly. Check your environment variables.")
+  log.error("Token not loaded properly. Check your environment variables.")
+log_listener.stop()